@@ -6,7 +6,15 @@ Uses pydantic-settings for type-safe configuration.
 """
 
 from pydantic_settings import BaseSettings
+from functools import lru_cache
 from typing import Optional
+import asyncio
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
 
 
 class Settings(BaseSettings):
@@ -33,25 +41,45 @@ class Settings(BaseSettings):
     GCP_REGION: str = "us-central1"
     
     # CORS Settings (for frontend)
-    ALLOWED_ORIGINS: list[str] = [
+    # A frozenset so the per-request origin check is a hash lookup
+    ALLOWED_ORIGINS: frozenset[str] = frozenset({
         "http://localhost:5173",  # Vite dev server
         "http://localhost:5174",  # Vite dev server (alternative port)
         "http://localhost:3000",  # Alternative dev port
         "https://voicecode-mentor.vercel.app",  # Production frontend
-    ]
+    })
+    
+    # Proxies allowed to set X-Forwarded-For (IPs or CIDRs). Cloud Run's
+    # front end reaches the container from a link-local address.
+    TRUSTED_PROXIES: frozenset[str] = frozenset({
+        "127.0.0.1",
+        "::1",
+        "169.254.0.0/16",
+    })
     
     # Firebase Auth (will add later)
     FIREBASE_PROJECT_ID: Optional[str] = None
     
     # API Keys (loaded from Secret Manager in production)
+    # With USE_SECRET_MANAGER enabled, keys left unset here are fetched
+    # from GCP Secret Manager on first use (see get_secret below)
     GEMINI_API_KEY: Optional[str] = None
     ELEVENLABS_API_KEY: Optional[str] = None
     ELEVENLABS_AGENT_ID: Optional[str] = None
+    USE_SECRET_MANAGER: bool = False
+    
+    # Voice proxy: forward client audio to ElevenLabs as raw binary frames
+    # instead of base64 JSON envelopes (only if the agent accepts them)
+    ELEVENLABS_RAW_AUDIO: bool = False
     
     # Rate Limiting (requests per minute)
     RATE_LIMIT_FREE_TIER: int = 10
     RATE_LIMIT_PRO_TIER: int = 100
     
+    # Shared rate-limit store, e.g. redis://10.0.0.3:6379/0
+    # (unset = in-memory limits per worker)
+    REDIS_URL: Optional[str] = None
+    
     class Config:
         # Load from .env file
         env_file = ".env"
@@ -59,8 +87,101 @@ class Settings(BaseSettings):
         case_sensitive = True
 
 
-# Create global settings instance
-settings = Settings()
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """
+    Return the application settings, built on first use.
+    
+    Parsing .env and the environment happens once per process; later
+    calls (including FastAPI `Depends(get_settings)`) hit the cache.
+    """
+    return Settings()
+
+
+# How long a failed or empty Secret Manager lookup is remembered before
+# the next attempt (successful lookups are kept for the process lifetime)
+SECRET_RETRY_SECONDS = 30
+
+# Secrets resolved so far: name -> (value, monotonic expiry)
+_secret_cache: dict[str, tuple[Optional[str], float]] = {}
+
+# One Secret Manager client per process (created on first lookup)
+_secret_client = None
+_secret_client_lock = threading.Lock()
+
+
+def _get_secret_client():
+    """Return the shared Secret Manager client, creating it on first use."""
+    global _secret_client
+    with _secret_client_lock:
+        if _secret_client is None:
+            # Imported here so the client library only loads when needed
+            from google.cloud import secretmanager
+            _secret_client = secretmanager.SecretManagerServiceClient()
+        return _secret_client
+
+
+def _cached_secret(name: str) -> tuple[bool, Optional[str]]:
+    """
+    Resolve a secret without any network I/O.
+    
+    Returns (True, value) when the answer is already known (set in the
+    environment, Secret Manager disabled, or cached), else (False, None).
+    """
+    settings = get_settings()
+    value = getattr(settings, name, None)
+    if value or not settings.USE_SECRET_MANAGER:
+        return True, value
+    
+    cached = _secret_cache.get(name)
+    if cached is not None and time.monotonic() < cached[1]:
+        return True, cached[0]
+    
+    return False, None
+
+
+def get_secret(name: str) -> Optional[str]:
+    """
+    Resolve an API key setting by name, deferring Secret Manager lookups.
+    
+    Values from .env / environment variables always win. Otherwise, if
+    USE_SECRET_MANAGER is enabled, the secret is fetched on first access
+    instead of during startup, so a cold start only pays the round-trip
+    for secrets the first request actually needs.
+    
+    This blocks on the Secret Manager RPC; from async code use
+    aget_secret instead.
+    """
+    known, value = _cached_secret(name)
+    if known:
+        return value
+    
+    settings = get_settings()
+    try:
+        client = _get_secret_client()
+        secret_path = f"projects/{settings.GCP_PROJECT_ID}/secrets/{name}/versions/latest"
+        response = client.access_secret_version(name=secret_path)
+        value = response.payload.data.decode("utf-8") or None
+        
+    except Exception as e:
+        logger.error(f"❌ Failed to load secret {name} from Secret Manager: {str(e)}")
+        value = None
+    
+    # Remember misses briefly so a missing secret isn't re-fetched per request
+    expires_at = math.inf if value else time.monotonic() + SECRET_RETRY_SECONDS
+    _secret_cache[name] = (value, expires_at)
+    return value
+
+
+async def aget_secret(name: str) -> Optional[str]:
+    """
+    Async get_secret: cached values return immediately, and Secret
+    Manager lookups run in a worker thread off the event loop.
+    """
+    known, value = _cached_secret(name)
+    if known:
+        return value
+    return await asyncio.to_thread(get_secret, name)
 
 
 # Validation: Ensure required settings are present
@@ -69,12 +190,16 @@ def validate_settings():
     Validate that all required settings are configured.
     Called on application startup.
     """
+    settings = get_settings()
+    
     if not settings.GCP_PROJECT_ID:
         raise ValueError(
             "GCP_PROJECT_ID is required. Set it in .env or environment variables."
         )
     
-    if not settings.GEMINI_API_KEY:
+    # Chat needs Gemini on the first request, so resolve it now
+    gemini_api_key = get_secret("GEMINI_API_KEY")
+    if not gemini_api_key:
         raise ValueError(
             "GEMINI_API_KEY is required for chat functionality. "
             "Get it from: https://makersuite.google.com/app/apikey"
@@ -84,11 +209,14 @@ def validate_settings():
     print(f"   Project: {settings.GCP_PROJECT_ID}")
     print(f"   Region: {settings.GCP_REGION}")
     print(f"   Debug: {settings.DEBUG}")
-    print(f"   Gemini API Key: {'*' * 20}{settings.GEMINI_API_KEY[-4:]}")
+    print(f"   Gemini API Key: {'*' * 20}{gemini_api_key[-4:]}")
     
     # Optional: ElevenLabs (for voice features)
+    # Don't touch Secret Manager here - voice keys load on first connection
     if settings.ELEVENLABS_API_KEY and settings.ELEVENLABS_AGENT_ID:
         print(f"   ElevenLabs: ✅ Configured")
+    elif settings.USE_SECRET_MANAGER:
+        print(f"   ElevenLabs: 🔐 Deferred to Secret Manager (loaded on first use)")
     else:
         print(f"   ElevenLabs: ⚠️ Not configured (voice features disabled)")
 
@@ -11,13 +11,21 @@ Architecture:
 - Firebase Auth for authentication
 """
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from app.config import settings, validate_settings
+from fastapi.responses import ORJSONResponse
+from starlette.websockets import WebSocketClose
+from app.config import Settings, get_settings, aget_secret, validate_settings
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Optional
+import asyncio
+import ipaddress
 import logging
 import os
 
+settings = get_settings()
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO if not settings.DEBUG else logging.DEBUG,
@@ -25,6 +33,90 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+# ============================================================================
+# STARTUP & SHUTDOWN (LIFESPAN)
+# ============================================================================
+
+async def warm_vertex_ai():
+    """
+    Load the Gemini SDK and build the model client.
+    Runs in a worker thread because the import and setup are blocking.
+    """
+    def _load():
+        from app.services.vertex_ai_service import vertex_ai_service
+        return vertex_ai_service
+    
+    try:
+        await asyncio.to_thread(_load)
+        logger.info("🔥 Vertex AI client warmed up")
+    except Exception as e:
+        # Chat will retry the import (and report the error) on first use
+        logger.warning(f"⚠️ Vertex AI warm-up failed: {str(e)}")
+
+
+async def warm_elevenlabs():
+    """
+    Resolve the ElevenLabs credentials ahead of the first voice connection.
+    """
+    try:
+        await asyncio.gather(
+            aget_secret("ELEVENLABS_API_KEY"),
+            aget_secret("ELEVENLABS_AGENT_ID"),
+        )
+    except Exception as e:
+        logger.warning(f"⚠️ ElevenLabs warm-up failed: {str(e)}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Application lifespan: startup runs before `yield`, shutdown after.
+    
+    Only configuration is validated here. Routers and client warm-ups
+    load in a background task (see load_routers), so the server binds its
+    port and answers /health without waiting for the AI SDKs to import.
+    """
+    logger.info("🚀 Starting VoiceCode Mentor API...")
+    
+    try:
+        # Validate configuration
+        await asyncio.to_thread(validate_settings)
+        
+        # Load routers and warm up clients after the port opens
+        global routers_ready, routers_error
+        routers_ready = asyncio.Event()
+        routers_error = None
+        app.state.startup_task = asyncio.create_task(load_routers())
+        
+        # Drop idle rate-limit buckets in the background
+        from app.utils.rate_limiter import rate_limiter
+        app.state.rate_limit_reaper = asyncio.create_task(rate_limiter.reaper())
+        
+        # TODO: Initialize Firestore connection (Phase 2)
+        
+        logger.info("✅ Application startup complete")
+        logger.info(f"📍 Running in {settings.GCP_REGION}")
+        logger.info(f"🔗 API Docs: http://localhost:{settings.PORT}/api/docs")
+        
+    except Exception as e:
+        logger.error(f"❌ Startup failed: {str(e)}")
+        raise
+    
+    yield
+    
+    logger.info("👋 Shutting down VoiceCode Mentor API...")
+    
+    # Stop background startup work if it's still running
+    app.state.startup_task.cancel()
+    app.state.rate_limit_reaper.cancel()
+    
+    # TODO: Close Firestore connection (Phase 2)
+    # TODO: Clean up any resources
+    
+    logger.info("✅ Shutdown complete")
+
+
 # Create FastAPI application
 app = FastAPI(
     title=settings.APP_NAME,
@@ -32,8 +124,65 @@ app = FastAPI(
     description="AI-powered coding mentor with voice and chat interfaces",
     docs_url="/api/docs",      # Swagger UI
     redoc_url="/api/redoc",    # ReDoc UI
+    default_response_class=ORJSONResponse,  # orjson: faster serialization
+    lifespan=lifespan,
 )
 
+# /api/* routes served by the app itself rather than the API routers
+APP_API_PATHS = frozenset({"/api/info", "/api/docs", "/api/redoc"})
+
+
+class WaitForRoutersMiddleware:
+    """
+    Hold /api/* requests (HTTP and WebSocket) until the background
+    router load has finished, so early traffic doesn't get a 404.
+    Routes defined on the app itself (APP_API_PATHS) are never held.
+    
+    Requests get a 503 instead if the routers failed to load, aren't
+    ready within ROUTERS_WAIT_SECONDS, or will never load because the
+    app was started without its lifespan.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        ready = routers_ready
+        if (
+            scope["type"] in ("http", "websocket")
+            and scope["path"].startswith("/api/")
+            and scope["path"] not in APP_API_PATHS
+            and (ready is None or not ready.is_set() or routers_error)
+        ):
+            if ready is not None:
+                try:
+                    await asyncio.wait_for(ready.wait(), ROUTERS_WAIT_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+            
+            if ready is None or not ready.is_set() or routers_error:
+                if scope["type"] == "websocket":
+                    # 1013: try again later
+                    await WebSocketClose(code=1013)(scope, receive, send)
+                else:
+                    response = ORJSONResponse(
+                        status_code=503,
+                        content={
+                            "error": "service_unavailable",
+                            "message": "API is not available, please retry shortly"
+                        }
+                    )
+                    await response(scope, receive, send)
+                return
+        
+        await self.app(scope, receive, send)
+
+
+# Added before CORS so CORSMiddleware wraps it: preflights are answered
+# without waiting, and our 503s still carry the CORS headers
+app.add_middleware(WaitForRoutersMiddleware)
+
+
 # CORS Middleware (allows frontend to call backend)
 app.add_middleware(
     CORSMiddleware,
@@ -44,46 +193,60 @@ app.add_middleware(
 )
 
 
-# ============================================================================
-# STARTUP & SHUTDOWN EVENTS
-# ============================================================================
-
-@app.on_event("startup")
-async def startup_event():
+class ClientIPMiddleware:
     """
-    Called when the application starts.
-    Initialize connections, validate configuration, etc.
+    Resolve the client IP once per request/connection and store it on
+    `request.state.client_ip` (also available on WebSocket state).
+    
+    X-Forwarded-For is only honoured when the socket peer is one of our
+    own proxies (settings.TRUSTED_PROXIES, e.g. Cloud Run's front end).
+    The client is then the rightmost entry those proxies didn't add
+    themselves; earlier entries are whatever the client chose to send.
+    Otherwise the socket peer address is the client.
     """
-    logger.info("🚀 Starting VoiceCode Mentor API...")
     
-    try:
-        # Validate configuration
-        validate_settings()
+    def __init__(self, app):
+        self.app = app
+        networks = tuple(
+            ipaddress.ip_network(proxy, strict=False)
+            for proxy in settings.TRUSTED_PROXIES
+        )
         
-        # TODO: Initialize Firestore connection (Phase 2)
-        # TODO: Initialize Vertex AI client (Phase 3)
+        @lru_cache(maxsize=4096)
+        def is_trusted(ip: str) -> bool:
+            try:
+                address = ipaddress.ip_address(ip)
+            except ValueError:
+                return False
+            return any(address in network for network in networks)
         
-        logger.info("✅ Application startup complete")
-        logger.info(f"📍 Running in {settings.GCP_REGION}")
-        logger.info(f"🔗 API Docs: http://localhost:{settings.PORT}/api/docs")
+        self._is_trusted = is_trusted
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket"):
+            client = scope.get("client")
+            client_ip = client[0] if client else "unknown"
+            
+            if client and self._is_trusted(client_ip):
+                for name, value in scope["headers"]:
+                    if name == b"x-forwarded-for":
+                        # Walk the comma-separated list from the right
+                        rest = value.decode("latin-1")
+                        while rest:
+                            rest, _, hop = rest.rpartition(",")
+                            hop = hop.strip()
+                            if hop:
+                                client_ip = hop
+                                if not self._is_trusted(hop):
+                                    break
+                        break
+            
+            scope.setdefault("state", {})["client_ip"] = client_ip
         
-    except Exception as e:
-        logger.error(f"❌ Startup failed: {str(e)}")
-        raise
+        await self.app(scope, receive, send)
 
 
-@app.on_event("shutdown")
-async def shutdown_event():
-    """
-    Called when the application shuts down.
-    Clean up connections, save state, etc.
-    """
-    logger.info("👋 Shutting down VoiceCode Mentor API...")
-    
-    # TODO: Close Firestore connection (Phase 2)
-    # TODO: Clean up any resources
-    
-    logger.info("✅ Shutdown complete")
+app.add_middleware(ClientIPMiddleware)
 
 
 # ============================================================================
@@ -91,7 +254,7 @@ async def shutdown_event():
 # ============================================================================
 
 @app.get("/")
-async def root():
+async def root(settings: Settings = Depends(get_settings)):
     """
     Root endpoint - basic health check.
     Returns application information.
@@ -105,11 +268,25 @@ async def root():
 
 
 @app.get("/health")
-async def health_check():
+async def health_check(settings: Settings = Depends(get_settings)):
     """
     Detailed health check endpoint.
     Used by Cloud Run to verify the service is healthy.
+    
+    Returns 503 if the API routers failed to load, so a broken revision
+    doesn't pass health checks while /api/* is unavailable.
     """
+    if routers_error:
+        return ORJSONResponse(
+            status_code=503,
+            content={
+                "status": "unhealthy",
+                "service": settings.APP_NAME,
+                "version": settings.APP_VERSION,
+                "error": f"API routers failed to load: {routers_error}",
+            }
+        )
+    
     return {
         "status": "healthy",
         "service": settings.APP_NAME,
@@ -167,7 +344,7 @@ async def global_exception_handler(request, exc):
     """
     logger.error(f"Unhandled exception: {str(exc)}", exc_info=True)
     
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={
             "error": "Internal server error",
@@ -181,16 +358,62 @@ async def global_exception_handler(request, exc):
 # ROUTERS
 # ============================================================================
 
-# Import routers
-from app.routers import chat, voice, context
+# Routers (and the SDKs they pull in) are imported in the background after
+# startup, so / and /health can answer Cloud Run's startup probe first.
+# WaitForRoutersMiddleware holds /api/* requests until they're ready.
+
+# Created by the lifespan, so it belongs to the serving event loop
+# (None = no lifespan ran, and nothing will load the routers)
+routers_ready: Optional[asyncio.Event] = None
+
+# Set if the router load failed (reported by /health)
+routers_error: Optional[str] = None
+
+# Longest an /api/* request waits for the routers before getting a 503
+ROUTERS_WAIT_SECONDS = 30
+
+
+def import_routers():
+    """Import the router modules (blocking - runs in a worker thread)"""
+    from app.routers import chat, voice, context
+    return chat, voice, context
+
 
-# Include routers
-app.include_router(chat.router, prefix="/api/chat", tags=["chat"])
-app.include_router(voice.router, prefix="/api/voice", tags=["voice"])
-app.include_router(context.router, prefix="/api/context", tags=["context"])
-# TODO Phase 4: app.include_router(execute.router, prefix="/api/execute", tags=["execute"])
-# TODO Phase 5: app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
-# TODO Phase 6: app.include_router(progress.router, prefix="/api/progress", tags=["progress"])
+async def load_routers():
+    """
+    Background startup task: include the API routers, then warm up clients.
+    """
+    global routers_error
+    
+    try:
+        chat, voice, context = await asyncio.to_thread(import_routers)
+        
+        # Include routers
+        app.include_router(chat.router, prefix="/api/chat", tags=["chat"])
+        app.include_router(voice.router, prefix="/api/voice", tags=["voice"])
+        app.include_router(context.router, prefix="/api/context", tags=["context"])
+        # TODO Phase 4: app.include_router(execute.router, prefix="/api/execute", tags=["execute"])
+        # TODO Phase 5: app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
+        # TODO Phase 6: app.include_router(progress.router, prefix="/api/progress", tags=["progress"])
+        
+        # Routes changed - rebuild the OpenAPI schema on next docs request
+        app.openapi_schema = None
+        
+        logger.info("✅ API routers loaded")
+        
+    except Exception as e:
+        logger.error(f"❌ Failed to load API routers: {str(e)}", exc_info=True)
+        routers_error = str(e) or type(e).__name__
+    
+    finally:
+        # Release waiting requests even on failure (they'll get a 503)
+        routers_ready.set()
+    
+    # Warm up API clients in parallel
+    await asyncio.gather(
+        warm_vertex_ai(),
+        warm_elevenlabs(),
+    )
 
 
 # ============================================================================
@@ -1,52 +1,137 @@
-from pydantic import BaseModel, Field
-from typing import Optional, List
+"""
+In-memory session store.
+
+Sessions are plain slotted dataclasses rather than pydantic models:
+request data is validated by the API schemas before it gets here, so the
+stored records skip pydantic's per-instance overhead.
+"""
+
+from dataclasses import dataclass, field
+from typing import Callable, Optional, Deque
+import sys
+import time
 from datetime import datetime
+from collections import OrderedDict, deque
+from itertools import islice
+
+
+# Conversation messages kept per session (older ones are dropped)
+MAX_HISTORY_MESSAGES = 20
+
+# Summary line prefix per message role
+_ROLE_PREFIXES = {
+    "user": "- User: ",
+    "assistant": "- You (AI): ",
+}
+
+# Longest message excerpt shown in the conversation summary
+SUMMARY_CONTENT_MAX_CHARS = 150
+
+# Low-cardinality string fields shared across many sessions/messages.
+# Interning makes every copy point at one string object.
+_INTERNED_FIELDS = frozenset({"problem_id", "language"})
 
+# Fields update_session() is allowed to change
+_UPDATABLE_FIELDS = frozenset({
+    "current_code",
+    "problem_id",
+    "problem_title",
+    "language",
+    "hint_level",
+    "message_count",
+})
 
-class ConversationMessage(BaseModel):
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    """Intern a string value (None passes through)"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+@dataclass(slots=True)
+class ConversationMessage:
     """A single message in the conversation history"""
-    role: str = Field(..., description="'user' or 'assistant'")
-    content: str = Field(..., description="Message content")
-    timestamp: datetime = Field(default_factory=datetime.now)
+    role: str  # 'user' or 'assistant'
+    content: str
+    timestamp: float = field(default_factory=time.time)  # epoch seconds
+    
+    def __post_init__(self):
+        # Share one string object per role
+        self.role = sys.intern(self.role)
 
 
-class CodeSession(BaseModel):
+@dataclass(slots=True)
+class CodeSession:
     """
     Represents a user's coding session with cached context.
     This allows the backend to "remember" the user's state
     without requiring the frontend to resend everything.
     """
-    session_id: str = Field(..., description="Unique session identifier")
-    user_ip: str = Field(..., description="User's IP address (temporary auth)")
-    problem_id: Optional[str] = Field(None, description="Current problem ID (slug)")
-    problem_title: Optional[str] = Field(None, description="Current problem title (human-readable)")
-    current_code: str = Field("", description="Latest code state")
-    language: str = Field("python", description="Programming language")
-    hint_level: int = Field(0, ge=0, le=3, description="Number of hints used")
-    last_updated: datetime = Field(default_factory=datetime.now, description="Last sync timestamp")
-    message_count: int = Field(0, description="Number of messages in this session")
-    created_at: datetime = Field(default_factory=datetime.now, description="Session creation time")
-    conversation_history: List[ConversationMessage] = Field(
-        default_factory=list,
-        description="Recent conversation messages for context continuity"
+    session_id: str  # Unique session identifier
+    user_ip: str  # User's IP address (temporary auth)
+    problem_id: Optional[str] = None  # Current problem ID (slug)
+    problem_title: Optional[str] = None  # Current problem title (human-readable)
+    current_code: str = ""  # Latest code state
+    language: str = "python"  # Programming language
+    hint_level: int = 0  # Number of hints used (0-3)
+    last_updated_ts: float = field(default_factory=time.time)  # Last sync (epoch seconds)
+    message_count: int = 0  # Number of messages in this session
+    created_at: datetime = field(default_factory=datetime.now)  # Session creation time
+    # Recent conversation messages for context continuity
+    conversation_history: Deque[ConversationMessage] = field(
+        default_factory=lambda: deque(maxlen=MAX_HISTORY_MESSAGES)
     )
-
-    class Config:
-        json_schema_extra = {
-            "example": {
-                "session_id": "550e8400-e29b-41d4-a716-446655440000",
-                "user_ip": "127.0.0.1",
-                "problem_id": "two-sum",
-                "current_code": "def two_sum(nums, target):\n    pass",
-                "language": "python",
-                "hint_level": 1,
-                "message_count": 5,
-            }
-        }
+    
+    # Summary cache: rendered lines are built once per message, and the
+    # joined summary is reused until history changes
+    _summary_lines: Deque[str] = field(
+        default_factory=lambda: deque(maxlen=MAX_HISTORY_MESSAGES),
+        init=False, repr=False,
+    )
+    _history_version: int = field(default=0, init=False, repr=False)
+    _cached_summary: Optional[str] = field(default=None, init=False, repr=False)
+    _cached_summary_key: Optional[tuple] = field(default=None, init=False, repr=False)
+    
+    # Serialized voice context envelope, reused while problem/code are unchanged
+    _cached_context: Optional[str] = field(default=None, init=False, repr=False)
+    _cached_context_key: Optional[tuple] = field(default=None, init=False, repr=False)
+    
+    def __post_init__(self):
+        # Share one string object per problem ID / language
+        self.problem_id = _intern(self.problem_id)
+        self.language = _intern(self.language)
 
 # In-memory session store
 # TODO: Migrate to Firestore for production
-sessions: dict[str, CodeSession] = {}
+#
+# Ordered by last_updated_ts (oldest first): every write moves the session
+# to the end, so expired sessions are always at the front and cleanup
+# only touches the entries it actually removes.
+sessions: "OrderedDict[str, CodeSession]" = OrderedDict()
+
+# Hard cap on live sessions; the least recently updated one is evicted
+MAX_SESSIONS = 10000
+
+# Running totals for the stats endpoint, updated on every message_count
+# change and session removal so stats never have to scan all sessions
+_stats = {"active_sessions": 0, "total_messages": 0}
+
+
+def _set_message_count(session: CodeSession, count: int) -> None:
+    """Set a session's message_count and keep the running totals in sync"""
+    previous = session.message_count
+    session.message_count = count
+    _stats["total_messages"] += count - previous
+    _stats["active_sessions"] += (count > 0) - (previous > 0)
+
+def _forget(session: CodeSession) -> None:
+    """Remove a (just deleted) session's contribution to the running totals"""
+    _stats["total_messages"] -= session.message_count
+    _stats["active_sessions"] -= session.message_count > 0
+
+def _touch(session_id: str, session: CodeSession) -> None:
+    """Mark a session as updated and move it to the back of the LRU order"""
+    session.last_updated_ts = time.time()
+    sessions.move_to_end(session_id)
 
 def get_session(session_id: str) -> Optional[CodeSession]:
     """Retrieve a session by ID"""
@@ -59,56 +144,122 @@ def create_session(session_id: str, user_ip: str, **kwargs) -> CodeSession:
         user_ip=user_ip,
         **kwargs
     )
+    existing = sessions.get(session_id)
+    if existing:
+        _forget(existing)
+    
     sessions[session_id] = session
+    sessions.move_to_end(session_id)
+    
+    # Count any messages carried in by kwargs
+    _stats["total_messages"] += session.message_count
+    _stats["active_sessions"] += session.message_count > 0
+    
+    # Evict least recently updated sessions beyond the cap
+    while len(sessions) > MAX_SESSIONS:
+        _, evicted = sessions.popitem(last=False)
+        _forget(evicted)
+    
     return session
 
-def update_session(session_id: str, **updates) -> Optional[CodeSession]:
-    """Update an existing session"""
+def touch_session(session_id: str, message_increment: int = 0, **updates) -> Optional[CodeSession]:
+    """
+    Look up a session and update it in a single pass.
+    
+    Applies `updates` (only _UPDATABLE_FIELDS; values were already
+    validated by the request schema), adds `message_increment` to
+    message_count, and returns the session - or None if it doesn't exist.
+    """
     session = sessions.get(session_id)
     if not session:
         return None
     
-    for key, value in updates.items():
-        if hasattr(session, key):
-            setattr(session, key, value)
+    for key in updates.keys() & _UPDATABLE_FIELDS:
+        value = updates[key]
+        if key == "message_count":
+            _set_message_count(session, value)
+            continue
+        if key in _INTERNED_FIELDS:
+            value = _intern(value)
+        setattr(session, key, value)
     
-    session.last_updated = datetime.now()
+    if message_increment:
+        _set_message_count(session, session.message_count + message_increment)
+    
+    _touch(session_id, session)
     return session
 
+def update_session(session_id: str, **updates) -> Optional[CodeSession]:
+    """Update an existing session (see touch_session)"""
+    return touch_session(session_id, **updates)
+
+def delete_session(session_id: str) -> bool:
+    """Delete a session. Returns False if it didn't exist."""
+    session = sessions.pop(session_id, None)
+    if not session:
+        return False
+    
+    _forget(session)
+    return True
+
 def cleanup_old_sessions(max_age_hours: int = 24):
-    """Remove sessions older than max_age_hours"""
-    now = datetime.now()
-    to_remove = []
+    """
+    Remove sessions older than max_age_hours.
+    Sessions are kept oldest-first, so this stops at the first fresh one.
+    """
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
     
-    for session_id, session in sessions.items():
-        age = (now - session.last_updated).total_seconds() / 3600
-        if age > max_age_hours:
-            to_remove.append(session_id)
+    while sessions:
+        oldest = next(iter(sessions.values()))
+        if oldest.last_updated_ts >= cutoff:
+            break
+        sessions.popitem(last=False)
+        _forget(oldest)
+        removed += 1
     
-    for session_id in to_remove:
-        del sessions[session_id]
+    return removed
+
+
+def get_session_stats() -> dict:
+    """Session/message totals, read from running counters (O(1))"""
+    total_sessions = len(sessions)
+    total_messages = _stats["total_messages"]
     
-    return len(to_remove)
+    return {
+        "total_sessions": total_sessions,
+        "active_sessions": _stats["active_sessions"],
+        "total_messages": total_messages,
+        "avg_messages_per_session": total_messages / total_sessions if total_sessions > 0 else 0,
+    }
 
 
-def add_message(session_id: str, role: str, content: str, max_messages: int = 20) -> bool:
+def add_message(session_id: str, role: str, content: str) -> bool:
     """
     Add a message to the session's conversation history.
-    Keeps only the last max_messages to prevent memory bloat.
+    The history is a bounded deque, so only the last
+    MAX_HISTORY_MESSAGES are kept to prevent memory bloat.
     """
     session = sessions.get(session_id)
     if not session:
         return False
     
     message = ConversationMessage(role=role, content=content)
-    session.conversation_history.append(message)
     
-    # Trim to last N messages to prevent memory issues
-    if len(session.conversation_history) > max_messages:
-        session.conversation_history = session.conversation_history[-max_messages:]
+    # Render the summary line now (truncated once); anything that isn't
+    # the user is labelled as the AI, as in the original summary
+    if len(content) > SUMMARY_CONTENT_MAX_CHARS:
+        content = content[:SUMMARY_CONTENT_MAX_CHARS] + "..."
+    summary_line = _ROLE_PREFIXES.get(role, "- You (AI): ") + content
+    
+    # Append to both deques together so they stay aligned, then
+    # invalidate the cache
+    session.conversation_history.append(message)
+    session._summary_lines.append(summary_line)
+    session._history_version += 1
     
-    session.message_count += 1
-    session.last_updated = datetime.now()
+    _set_message_count(session, session.message_count + 1)
+    _touch(session_id, session)
     return True
 
 
@@ -116,25 +267,48 @@ def get_conversation_summary(session_id: str, max_exchanges: int = 5) -> str:
     """
     Build a concise summary of recent conversation for context injection.
     Returns empty string if no history.
+    
+    The result is cached on the session until add_message changes history.
     """
     session = sessions.get(session_id)
     if not session or not session.conversation_history:
         return ""
     
-    # Get last N messages
-    recent = session.conversation_history[-max_exchanges * 2:]  # 2 messages per exchange
+    cache_key = (session._history_version, max_exchanges)
+    if session._cached_summary_key == cache_key:
+        return session._cached_summary
     
-    if not recent:
-        return ""
-    
-    summary_lines = ["[PREVIOUS CONVERSATION SUMMARY]"]
-    for msg in recent:
-        role_label = "User" if msg.role == "user" else "You (AI)"
-        # Truncate long messages
-        content = msg.content[:150] + "..." if len(msg.content) > 150 else msg.content
-        summary_lines.append(f"- {role_label}: {content}")
+    # Get last N pre-rendered lines (2 messages per exchange)
+    lines = session._summary_lines
+    recent = islice(lines, max(0, len(lines) - max_exchanges * 2), None)
     
-    summary_lines.append("[END OF SUMMARY - Continue from where we left off]")
+    summary = "\n".join([
+        "[PREVIOUS CONVERSATION SUMMARY]",
+        *recent,
+        "[END OF SUMMARY - Continue from where we left off]",
+    ])
     
-    return "\n".join(summary_lines)
+    session._cached_summary = summary
+    session._cached_summary_key = cache_key
+    return summary
+
 
+
+def get_context_envelope(session: CodeSession, builder: Callable[[CodeSession], str]) -> str:
+    """
+    Return a session's voice context envelope, building it with `builder`
+    only when the problem, language or code changed since the last call.
+    
+    The result is cached on the session, so reconnects with unchanged
+    code skip the string building and JSON encoding.
+    """
+    code = session.current_code or ""
+    cache_key = (session.problem_id, session.language, len(code), hash(code))
+    if session._cached_context_key == cache_key:
+        return session._cached_context
+    
+    envelope = builder(session)
+    
+    session._cached_context = envelope
+    session._cached_context_key = cache_key
+    return envelope
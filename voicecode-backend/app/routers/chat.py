@@ -7,11 +7,10 @@ No authentication required (stateless MVP).
 Rate limited by IP address.
 """
 
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request
 from app.schemas.chat import ChatRequest, ChatResponse, ErrorResponse
-from app.services.vertex_ai_service import vertex_ai_service
 from app.utils.rate_limiter import rate_limit
-from app.models.session import get_session, update_session
+from app.models.session import touch_session
 import logging
 
 logger = logging.getLogger(__name__)
@@ -30,6 +29,7 @@ router = APIRouter(tags=["chat"])
         500: {"model": ErrorResponse, "description": "AI service error"}
     },
     summary="Chat with AI Mentor",
+    dependencies=[Depends(rate_limit(max_requests=10, window_seconds=60))],
     description="""
     Send a message to the AI coding mentor.
     
@@ -52,7 +52,6 @@ router = APIRouter(tags=["chat"])
     ```
     """
 )
-@rate_limit(max_requests=10, window_seconds=60)
 async def chat(
     request: Request,
     chat_request: ChatRequest
@@ -63,7 +62,7 @@ async def chat(
     This is the main endpoint for AI conversations.
     
     Args:
-        request: FastAPI Request object (for rate limiting)
+        request: FastAPI Request object (client IP, session header)
         chat_request: Validated request body
     
     Returns:
@@ -74,17 +73,20 @@ async def chat(
     """
     
     try:
+        # Imported on first use so the Gemini SDK doesn't load during cold start
+        from app.services.vertex_ai_service import vertex_ai_service
+        
         # Log request (helpful for debugging)
-        client_ip = request.client.host if request.client else "unknown"
+        client_ip = request.state.client_ip
         logger.info(
-            f"💬 Chat request from {client_ip}: "
-            f'"{chat_request.message[:50]}..." '
-            f"(problem: {chat_request.problem_id}, hint_level: {chat_request.hint_level})"
+            '💬 Chat request from %s: "%.50s..." (problem: %s, hint_level: %s)',
+            client_ip, chat_request.message, chat_request.problem_id, chat_request.hint_level
         )
         
         # Try to use cached context from session
+        # (one lookup fetches it and bumps the message count)
         session_id = request.headers.get("X-Session-ID")
-        session = get_session(session_id) if session_id else None
+        session = touch_session(session_id, message_increment=1) if session_id else None
         
         if session:
             # Use cached context from session (saves tokens!)
@@ -92,13 +94,11 @@ async def chat(
             problem_id = chat_request.problem_id if chat_request.problem_id is not None else session.problem_id
             hint_level = chat_request.hint_level if chat_request.hint_level is not None else session.hint_level
             
-            # Update session message count
-            update_session(session_id, message_count=session.message_count + 1)
-            
-            logger.debug(
-                f"📋 Using session context: {session_id[:8]}... "
-                f"(code: {len(code)} chars, cached: {code == session.current_code})"
-            )
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "📋 Using session context: %.8s... (code: %d chars, cached: %s)",
+                    session_id, len(code), code == session.current_code
+                )
         else:
             # No session - use request data directly (fallback)
             code = chat_request.code
@@ -117,8 +117,8 @@ async def chat(
         
         # Log success
         logger.info(
-            f"✅ Chat response generated: {result['tokens_used']} tokens used "
-            f"(session: {'yes' if session else 'no'})"
+            "✅ Chat response generated: %s tokens used (session: %s)",
+            result["tokens_used"], "yes" if session else "no"
         )
         
         # Return response (include session_id if available)
@@ -166,8 +166,10 @@ async def chat_health():
     """
     
     try:
+        from app.services.vertex_ai_service import vertex_ai_service
+        
         # Check if Vertex AI service is initialized
-        if vertex_ai_service.model is None:
+        if vertex_ai_service.client is None:
             raise Exception("Vertex AI model not initialized")
         
         return {
@@ -1,15 +1,18 @@
 from fastapi import APIRouter, Request, HTTPException, status
 from pydantic import BaseModel, Field
 from typing import Optional, List
+from datetime import datetime
 import uuid
 import logging
 from app.models.session import (
     get_session,
     create_session,
     update_session,
+    delete_session as remove_session,
     cleanup_old_sessions,
     add_message,
     get_conversation_summary,
+    get_session_stats,
     sessions,
 )
 
@@ -36,7 +39,7 @@ async def sync_context(request: ContextSyncRequest, http_request: Request):
     Background context sync endpoint.
     Called automatically by frontend every 5 seconds to keep context up-to-date.
     """
-    client_ip = http_request.client.host
+    client_ip = http_request.state.client_ip
     session_id = http_request.headers.get("X-Session-ID", "")
     
     try:
@@ -55,7 +58,7 @@ async def sync_context(request: ContextSyncRequest, http_request: Request):
                 language=request.language,
                 hint_level=request.hint_level,
             )
-            logger.info(f"✨ Created new session: {session_id[:8]}... for {client_ip}")
+            logger.info("✨ Created new session: %.8s... for %s", session_id, client_ip)
         else:
             # Update existing session
             update_session(
@@ -66,7 +69,10 @@ async def sync_context(request: ContextSyncRequest, http_request: Request):
                 language=request.language,
                 hint_level=request.hint_level,
             )
-            logger.info(f"🔄 Updated session: {session_id[:8]}... (problem_id={request.problem_id}, problem_title={request.problem_title}, code: {len(request.code or '')} chars)")
+            logger.info(
+                "🔄 Updated session: %.8s... (problem_id=%s, problem_title=%s, code: %d chars)",
+                session_id, request.problem_id, request.problem_title, len(request.code or "")
+            )
         
         return ContextSyncResponse(
             session_id=session_id,
@@ -99,16 +105,15 @@ async def get_session_info(session_id: str):
         "hint_level": session.hint_level,
         "code_length": len(session.current_code),
         "message_count": session.message_count,
-        "last_updated": session.last_updated.isoformat(),
+        "last_updated": datetime.fromtimestamp(session.last_updated_ts).isoformat(),
         "created_at": session.created_at.isoformat(),
     }
 
 @router.delete("/session/{session_id}")
 async def delete_session(session_id: str):
     """Delete a session (logout/reset)"""
-    if session_id in sessions:
-        del sessions[session_id]
-        logger.info(f"🗑️ Deleted session: {session_id[:8]}...")
+    if remove_session(session_id):
+        logger.info("🗑️ Deleted session: %.8s...", session_id)
         return {"message": "Session deleted"}
     
     raise HTTPException(
@@ -119,22 +124,13 @@ async def delete_session(session_id: str):
 @router.get("/stats")
 async def context_stats():
     """Get context service statistics"""
-    total_sessions = len(sessions)
-    active_sessions = sum(1 for s in sessions.values() if s.message_count > 0)
-    total_messages = sum(s.message_count for s in sessions.values())
-    
-    return {
-        "total_sessions": total_sessions,
-        "active_sessions": active_sessions,
-        "total_messages": total_messages,
-        "avg_messages_per_session": total_messages / total_sessions if total_sessions > 0 else 0,
-    }
+    return get_session_stats()
 
 @router.post("/cleanup")
 async def cleanup_sessions(max_age_hours: int = 24):
     """Cleanup old sessions (admin endpoint)"""
     removed = cleanup_old_sessions(max_age_hours)
-    logger.info(f"🧹 Cleaned up {removed} old sessions")
+    logger.info("🧹 Cleaned up %d old sessions", removed)
     return {
         "removed": removed,
         "remaining": len(sessions),
@@ -171,7 +167,7 @@ async def add_conversation_message(request: ConversationMessageRequest, http_req
     success = add_message(session_id, request.role, request.content)
     
     if success:
-        logger.debug(f"💬 Added {request.role} message to {session_id[:8]}... ({len(request.content)} chars)")
+        logger.debug("💬 Added %s message to %.8s... (%d chars)", request.role, session_id, len(request.content))
         return {
             "success": True,
             "message_count": session.message_count,
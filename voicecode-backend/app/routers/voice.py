@@ -15,25 +15,230 @@ Audio flows in both directions simultaneously:
 - ElevenLabs → Backend → Frontend (AI responding)
 """
 
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException, Response
 from fastapi.websockets import WebSocketState
 import websockets
 import asyncio
 import logging
-import json
-import base64
-from datetime import datetime
+import socket
+import time
+from dataclasses import dataclass
+from operator import attrgetter
+import orjson
+import pybase64
 from app.services.elevenlabs_service import elevenlabs_service
-from app.config import settings
-from app.models.session import get_session, get_conversation_summary
+from app.config import get_settings
+from app.models.session import get_session, get_conversation_summary, get_context_envelope
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["voice"])
 
 
+@dataclass(slots=True)
+class ConnectionInfo:
+    """Bookkeeping for one active voice connection"""
+    client_ip: str
+    connected_at: float  # time.monotonic() at connect
+    characters_used: int = 0
+
+
 # Track active connections for monitoring
-active_connections = {}
+active_connections: dict[str, ConnectionInfo] = {}
+
+_get_characters_used = attrgetter("characters_used")
+
+# JSON envelope for base64 audio sent to ElevenLabs: {"user_audio_chunk": "..."}
+_AUDIO_CHUNK_PREFIX = '{"user_audio_chunk": "'
+_AUDIO_CHUNK_SUFFIX = '"}'
+
+# Error messages for the client, serialized once (sent as text frames)
+_ERR_NOT_CONFIGURED = orjson.dumps({
+    "type": "error",
+    "message": "Voice service not configured. Please set ELEVENLABS_API_KEY and ELEVENLABS_AGENT_ID."
+}).decode()
+_ERR_CONNECTION_LOST = orjson.dumps({
+    "type": "error",
+    "message": "Lost connection to voice service"
+}).decode()
+_ERR_INTERNAL = orjson.dumps({
+    "type": "error",
+    "message": "An error occurred in the voice service"
+}).decode()
+
+# Max frames queued per direction before the reader has to wait
+VOICE_QUEUE_MAXSIZE = 64
+
+# Max frames queued for the client before the reader has to wait
+CLIENT_QUEUE_MAXSIZE = 32
+
+# A send to the client stuck for longer than this means the client is
+# falling behind: from then on a full queue sheds its oldest audio
+SLOW_CLIENT_SECONDS = 0.25
+
+
+class FramePipe:
+    """
+    Outbound frame queue for one direction of the voice proxy.
+    
+    Audio chunks (bytes) already queued when the writer wakes up are
+    concatenated and sent as one frame, so a burst of chunks costs fewer
+    sends/TLS records. The writer never waits for more audio to arrive:
+    a lone chunk goes out immediately. Text frames go out as-is and in
+    order (any pending audio is flushed first). The queue is bounded, so a
+    slow peer applies back-pressure to the reader. With drop_audio=True,
+    a full queue sheds its oldest audio chunk instead, but only while a
+    send has been stuck for SLOW_CLIENT_SECONDS; a burst that merely
+    outruns one loop turn just waits for the writer, so a fast peer never
+    loses audio (text frames are never dropped).
+    
+    Must be created from the reader task: if sending fails, the reader is
+    cancelled so it doesn't block on a queue nobody drains.
+    """
+    
+    def __init__(self, send_audio, send_text, maxsize=VOICE_QUEUE_MAXSIZE, drop_audio=False):
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self._send_audio = send_audio
+        self._send_text = send_text
+        self._drop_audio = drop_audio
+        self._send_started = None  # monotonic time of the send in progress
+        self._reader = asyncio.current_task()
+        self._writer = asyncio.create_task(self._flusher())
+    
+    @property
+    def error(self):
+        """Exception that stopped the writer, if any"""
+        if self._writer.done() and not self._writer.cancelled():
+            return self._writer.exception()
+        return None
+    
+    async def put(self, frame):
+        """Queue an audio (bytes) or text (str) frame"""
+        if (
+            self._drop_audio
+            and isinstance(frame, bytes)
+            and self.queue.full()
+            and self._stalled()
+        ):
+            self._drop_oldest_audio()
+        await self.queue.put(frame)
+    
+    async def close(self):
+        """Flush everything queued so far, then stop the writer"""
+        await self.queue.put(None)
+        await self._writer
+    
+    def cancel(self):
+        """Stop the writer, dropping anything still queued"""
+        self._writer.cancel()
+    
+    def _stalled(self):
+        """True if the send in progress has run past SLOW_CLIENT_SECONDS"""
+        started = self._send_started
+        return started is not None and time.monotonic() - started > SLOW_CLIENT_SECONDS
+    
+    def _drop_oldest_audio(self):
+        """Make room by discarding the oldest queued audio chunk"""
+        queue = self.queue
+        frames = [queue.get_nowait() for _ in range(queue.qsize())]
+        for i, frame in enumerate(frames):
+            if isinstance(frame, bytes):
+                del frames[i]
+                self.dropped += 1
+                break
+        for frame in frames:
+            queue.put_nowait(frame)
+    
+    async def _flusher(self):
+        queue = self.queue
+        try:
+            while True:
+                frame = await queue.get()
+                if isinstance(frame, bytes):
+                    # Let the reader queue anything it has already received
+                    # (one loop turn, no timed wait)
+                    await asyncio.sleep(0)
+                
+                frames = [frame]
+                while not queue.empty():
+                    frames.append(queue.get_nowait())
+                
+                self._send_started = time.monotonic()
+                audio = []
+                for frame in frames:
+                    if isinstance(frame, bytes):
+                        audio.append(frame)
+                        continue
+                    if audio:
+                        await self._send_audio(b"".join(audio))
+                        audio = []
+                    if frame is None:
+                        return
+                    await self._send_text(frame)
+                
+                if audio:
+                    await self._send_audio(b"".join(audio))
+                self._send_started = None
+        
+        except Exception:
+            self._reader.cancel()
+            raise
+
+
+def tune_socket(sock) -> None:
+    """
+    Set low-latency / keep-alive options on a connected TCP socket.
+    
+    TCP_NODELAY stops Nagle from holding back small audio frames, and
+    keep-alive probes (after 30s idle, every 15s, 4 tries) let the kernel
+    notice a dead peer. Options the platform lacks are skipped.
+    """
+    if sock is None:
+        return
+    
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    for option, value in (("TCP_KEEPIDLE", 30), ("TCP_KEEPINTVL", 15), ("TCP_KEEPCNT", 4)):
+        if hasattr(socket, option):
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+
+async def _safe_close(ws) -> None:
+    """Close a WebSocket, ignoring ones that are missing or already closed"""
+    if ws is None:
+        return
+    try:
+        await ws.close()
+    except Exception:
+        pass
+
+
+def build_context_envelope(session) -> str:
+    """
+    Build the JSON context message sent to ElevenLabs when a call starts.
+    
+    Called through get_context_envelope, which caches the result on the
+    session until its code changes.
+    """
+    code = session.current_code or ""
+    
+    # Build context message focused on their code
+    context_message = "⚠️ CONTEXT: The student is working on the Two Sum problem.\n\n"
+    
+    if code and len(code.strip()) > 0:
+        # Send full code (up to 800 chars) so AI can analyze it
+        code_snippet = code[:800] + ("..." if len(code) > 800 else "")
+        context_message += f"Here's their current {session.language} code:\n\n{code_snippet}\n\n"
+        context_message += "You can see their code. Help them find errors, suggest improvements, or guide them with the Socratic method."
+    else:
+        context_message += "They haven't written any code yet. Help them get started!"
+    
+    # Decode so it still goes out as a text frame
+    return orjson.dumps({
+        "type": "text",
+        "text": context_message
+    }).decode()
 
 
 @router.websocket("/stream")
@@ -63,26 +268,23 @@ async def voice_stream(websocket: WebSocket, session_id: str = None):
     # Accept client connection
     await websocket.accept()
     
-    client_ip = websocket.client.host if websocket.client else "unknown"
-    connection_id = f"{client_ip}_{datetime.now().timestamp()}"
+    client_ip = websocket.state.client_ip
+    connection_id = f"{client_ip}_{time.monotonic_ns()}"
     
     logger.info(f"🎤 Voice connection opened: {connection_id} (session: {session_id[:8] if session_id else 'none'}...)")
     
     # Check if ElevenLabs is configured
-    if not elevenlabs_service.api_key or not elevenlabs_service.agent_id:
-        await websocket.send_json({
-            "type": "error",
-            "message": "Voice service not configured. Please set ELEVENLABS_API_KEY and ELEVENLABS_AGENT_ID."
-        })
+    api_key, agent_id = await elevenlabs_service.load_credentials()
+    if not api_key or not agent_id:
+        await websocket.send_text(_ERR_NOT_CONFIGURED)
         await websocket.close()
         return
     
     # Track connection
-    active_connections[connection_id] = {
-        "client_ip": client_ip,
-        "connected_at": datetime.now(),
-        "characters_used": 0
-    }
+    active_connections[connection_id] = ConnectionInfo(
+        client_ip=client_ip,
+        connected_at=time.monotonic()
+    )
     
     elevenlabs_ws = None
     
@@ -93,16 +295,27 @@ async def voice_stream(websocket: WebSocket, session_id: str = None):
         
         logger.info(f"🔗 Connecting to ElevenLabs for {connection_id}...")
         
+        # permessage-deflate pays off on JSON/base64 frames; raw PCM barely
+        # compresses, so skip it when audio goes over as binary frames
+        compression = None if get_settings().ELEVENLABS_RAW_AUDIO else "deflate"
+        
         # Open connection to ElevenLabs
         elevenlabs_ws = await websockets.connect(
             url,
             extra_headers=headers,  # Pass authentication headers
+            ssl=elevenlabs_service.ssl_context,  # Shared TLS context
+            compression=compression,
             ping_interval=20,  # Keep-alive ping every 20 seconds
             ping_timeout=10
         )
         
         logger.info(f"✅ ElevenLabs connected for {connection_id}")
         
+        try:
+            tune_socket(elevenlabs_ws.transport.get_extra_info("socket"))
+        except OSError as e:
+            logger.warning(f"⚠️  Could not set socket options for {connection_id}: {e}")
+        
         # 🎯 INJECT CONTEXT if session exists
         if session_id:
             session = get_session(session_id)
@@ -113,28 +326,13 @@ async def voice_stream(websocket: WebSocket, session_id: str = None):
 
             # ✅ IMMEDIATELY send context focused on CODE (hardcoded to Two Sum for demo)
             if session:
-                # Build context message focused on their code
-                context_message = "⚠️ CONTEXT: The student is working on the Two Sum problem.\n\n"
-                
-                if session.current_code and len(session.current_code.strip()) > 0:
-                    # Send full code (up to 800 chars) so AI can analyze it
-                    code_snippet = session.current_code[:800] + ("..." if len(session.current_code) > 800 else "")
-                    context_message += f"Here's their current {session.language} code:\n\n{code_snippet}\n\n"
-                    context_message += "You can see their code. Help them find errors, suggest improvements, or guide them with the Socratic method."
-                else:
-                    context_message += "They haven't written any code yet. Help them get started!"
-                
                 try:
                     # Send context as the very first message
-                    await elevenlabs_ws.send(json.dumps({
-                        "type": "text",
-                        "text": context_message
-                    }))
+                    await elevenlabs_ws.send(get_context_envelope(session, build_context_envelope))
                     code_len = len(session.current_code) if session.current_code else 0
                     logger.info(f"✅ Context sent: problem=two-sum, code_len={code_len}")
-                    
-                    # Small delay to ensure context is processed
-                    await asyncio.sleep(0.3)
+                    # No need to wait here: the socket delivers frames in
+                    # order, so the context always reaches ElevenLabs first
                     
                 except Exception as e:
                     logger.warning(f"⚠️  Failed to send context: {e}")
@@ -144,46 +342,49 @@ async def voice_stream(websocket: WebSocket, session_id: str = None):
         # 1. Frontend → ElevenLabs
         # 2. ElevenLabs → Frontend
         
-        await asyncio.gather(
-            forward_client_to_elevenlabs(websocket, elevenlabs_ws, connection_id),
-            forward_elevenlabs_to_client(elevenlabs_ws, websocket, connection_id),
-            return_exceptions=True
-        )
+        # When either direction finishes (disconnect or error), the call is
+        # over, so cancel the other one instead of waiting on its next frame.
+        # (asyncio.TaskGroup would do this, but it needs Python 3.11.)
+        tasks = {
+            asyncio.create_task(forward_client_to_elevenlabs(websocket, elevenlabs_ws, connection_id)),
+            asyncio.create_task(forward_elevenlabs_to_client(elevenlabs_ws, websocket, connection_id)),
+        }
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        
+        for task in done:
+            if not task.cancelled() and task.exception():
+                raise task.exception()
         
     except websockets.exceptions.WebSocketException as e:
         logger.error(f"❌ ElevenLabs WebSocket error for {connection_id}: {str(e)}")
         
         # Notify client
         if websocket.client_state == WebSocketState.CONNECTED:
-            await websocket.send_json({
-                "type": "error",
-                "message": "Lost connection to voice service"
-            })
+            await websocket.send_text(_ERR_CONNECTION_LOST)
     
     except Exception as e:
         logger.error(f"❌ Voice stream error for {connection_id}: {str(e)}", exc_info=True)
         
         # Notify client
         if websocket.client_state == WebSocketState.CONNECTED:
-            await websocket.send_json({
-                "type": "error",
-                "message": "An error occurred in the voice service"
-            })
+            await websocket.send_text(_ERR_INTERNAL)
     
     finally:
-        # Clean up connections
-        if elevenlabs_ws and not elevenlabs_ws.closed:
-            await elevenlabs_ws.close()
+        # Clean up connections (both at once; already-closed ones are a no-op)
+        await asyncio.gather(_safe_close(elevenlabs_ws), _safe_close(websocket))
+        if elevenlabs_ws:
             logger.info(f"🔌 ElevenLabs connection closed for {connection_id}")
         
-        if websocket.client_state == WebSocketState.CONNECTED:
-            await websocket.close()
-        
         # Log usage
         if connection_id in active_connections:
             conn_info = active_connections[connection_id]
-            duration = (datetime.now() - conn_info["connected_at"]).seconds
-            characters = conn_info["characters_used"]
+            duration = int(time.monotonic() - conn_info.connected_at)
+            characters = conn_info.characters_used
             cost = elevenlabs_service.calculate_cost(characters)
             minutes = elevenlabs_service.estimate_minutes_from_characters(characters)
             
@@ -216,6 +417,24 @@ async def forward_client_to_elevenlabs(
         elevenlabs_ws: WebSocket connection to ElevenLabs
         connection_id: Unique connection identifier
     """
+    raw_audio = get_settings().ELEVENLABS_RAW_AUDIO
+    
+    async def send_audio(audio: bytes):
+        if raw_audio:
+            # Send the audio frame through as-is (no base64/JSON)
+            await elevenlabs_ws.send(audio)
+        else:
+            # ElevenLabs expects audio as base64-encoded JSON.
+            # Base64 never needs JSON escaping, so splice it into
+            # the envelope directly instead of serializing a dict.
+            audio_base64 = pybase64.b64encode_as_string(audio)
+            await elevenlabs_ws.send(_AUDIO_CHUNK_PREFIX + audio_base64 + _AUDIO_CHUNK_SUFFIX)
+    
+    pipe = FramePipe(send_audio=send_audio, send_text=elevenlabs_ws.send)
+    
+    # Same record for the whole call, so look it up once rather than per frame
+    conn_info = active_connections.get(connection_id)
+    
     try:
         while True:
             # Receive message from client
@@ -230,30 +449,35 @@ async def forward_client_to_elevenlabs(
             # Forward to ElevenLabs
             if "text" in message:
                 # Text message (JSON control messages)
-                await elevenlabs_ws.send(message["text"])
-                logger.debug(f"→ Forwarded text to ElevenLabs: {connection_id}")
+                await pipe.put(message["text"])
+                logger.debug("→ Forwarded text to ElevenLabs: %s", connection_id)
                 
                 # Track characters (for cost calculation)
-                if connection_id in active_connections:
-                    text_data = json.loads(message["text"])
+                if conn_info is not None:
+                    text_data = orjson.loads(message["text"])
                     if "text" in text_data:
-                        active_connections[connection_id]["characters_used"] += len(text_data["text"])
+                        conn_info.characters_used += len(text_data["text"])
             
             elif "bytes" in message:
-                # Binary message (audio data)
-                # ElevenLabs expects audio as base64-encoded JSON
-                audio_base64 = base64.b64encode(message["bytes"]).decode('utf-8')
-                audio_message = json.dumps({
-                    "user_audio_chunk": audio_base64
-                })
-                await elevenlabs_ws.send(audio_message)
-                logger.debug(f"→ Forwarded audio to ElevenLabs: {connection_id} ({len(message['bytes'])} bytes)")
+                # Binary message (audio data), coalesced by the pipe
+                await pipe.put(message["bytes"])
+                logger.debug("→ Forwarded audio to ElevenLabs: %s (%d bytes)", connection_id, len(message["bytes"]))
+        
+        await pipe.close()
     
     except WebSocketDisconnect:
         logger.info(f"📴 Client WebSocket disconnected: {connection_id}")
     
+    except asyncio.CancelledError:
+        if pipe.error is None:
+            raise
+        logger.error(f"❌ Error forwarding to ElevenLabs for {connection_id}: {str(pipe.error)}")
+    
     except Exception as e:
         logger.error(f"❌ Error forwarding to ElevenLabs for {connection_id}: {str(e)}")
+    
+    finally:
+        pipe.cancel()
 
 
 async def forward_elevenlabs_to_client(
@@ -272,6 +496,17 @@ async def forward_elevenlabs_to_client(
         client_ws: WebSocket connection to frontend
         connection_id: Unique connection identifier
     """
+    # Same record for the whole call, so look it up once rather than per frame
+    conn_info = active_connections.get(connection_id)
+    
+    # Don't let a slow client make us buffer audio without bound
+    pipe = FramePipe(
+        send_audio=client_ws.send_bytes,
+        send_text=client_ws.send_text,
+        maxsize=CLIENT_QUEUE_MAXSIZE,
+        drop_audio=True
+    )
+    
     try:
         async for message in elevenlabs_ws:
             # Check if client is still connected
@@ -281,38 +516,59 @@ async def forward_elevenlabs_to_client(
             
             # Forward to client
             if isinstance(message, str):
-                # Text message (JSON)
-                message_data = json.loads(message)
+                # Text message (JSON). A cheap substring test decides whether
+                # it needs parsing at all; most events are forwarded untouched.
+                message_data = None
+                audio_bytes = None
                 
                 # Check if this is an audio response
-                if "audio_event" in message_data and "audio_base_64" in message_data["audio_event"]:
-                    # Decode base64 audio and send as binary
-                    audio_bytes = base64.b64decode(message_data["audio_event"]["audio_base_64"])
-                    await client_ws.send_bytes(audio_bytes)
-                    logger.info(f"🔊 Forwarded audio to client: {connection_id} ({len(audio_bytes)} bytes)")
+                if '"audio_base_64"' in message:
+                    message_data = orjson.loads(message)
+                    audio_event = message_data.get("audio_event")
+                    if audio_event and "audio_base_64" in audio_event:
+                        audio_bytes = pybase64.b64decode(audio_event["audio_base_64"], validate=False)
+                
+                if audio_bytes is not None:
+                    # Send decoded audio as binary (coalesced by the pipe)
+                    await pipe.put(audio_bytes)
+                    logger.debug("🔊 Forwarded audio to client: %s (%d bytes)", connection_id, len(audio_bytes))
                 else:
                     # Regular text message (transcripts, status, etc.)
-                    await client_ws.send_text(message)
-                    logger.debug(f"← Forwarded text to client: {connection_id}")
+                    await pipe.put(message)
+                    logger.debug("← Forwarded text to client: %s", connection_id)
                 
                 # Track characters (for cost calculation)
-                if connection_id in active_connections:
+                if conn_info is not None and ('"text"' in message or '"agent_response_event"' in message):
+                    if message_data is None:
+                        message_data = orjson.loads(message)
                     if "text" in message_data:
-                        active_connections[connection_id]["characters_used"] += len(message_data["text"])
+                        conn_info.characters_used += len(message_data["text"])
                     # Also track agent responses
                     if "agent_response_event" in message_data and "response" in message_data["agent_response_event"]:
-                        active_connections[connection_id]["characters_used"] += len(message_data["agent_response_event"]["response"])
+                        conn_info.characters_used += len(message_data["agent_response_event"]["response"])
             
             elif isinstance(message, bytes):
                 # Binary message (audio) - unlikely with ElevenLabs Conversational AI
-                await client_ws.send_bytes(message)
-                logger.debug(f"← Forwarded binary audio to client: {connection_id}")
+                await pipe.put(message)
+                logger.debug("← Forwarded binary audio to client: %s", connection_id)
+        
+        await pipe.close()
     
     except websockets.exceptions.ConnectionClosed:
         logger.info(f"📴 ElevenLabs connection closed: {connection_id}")
     
+    except asyncio.CancelledError:
+        if pipe.error is None:
+            raise
+        logger.error(f"❌ Error forwarding to client for {connection_id}: {str(pipe.error)}")
+    
     except Exception as e:
         logger.error(f"❌ Error forwarding to client for {connection_id}: {str(e)}")
+    
+    finally:
+        pipe.cancel()
+        if pipe.dropped:
+            logger.warning(f"⚠️  Dropped {pipe.dropped} audio chunks for slow client: {connection_id}")
 
 
 @router.get("/health")
@@ -326,23 +582,27 @@ async def voice_health():
     try:
         # Test ElevenLabs connection
         is_connected = await elevenlabs_service.validate_connection()
+        now = time.monotonic()
         
-        return {
+        # Serialize straight to bytes so FastAPI doesn't walk the whole
+        # connection list through jsonable_encoder first
+        payload = {
             "status": "healthy" if is_connected else "degraded",
             "service": "voice",
-            "elevenlabs_configured": bool(elevenlabs_service.api_key and elevenlabs_service.agent_id),
+            "elevenlabs_configured": is_connected,
             "elevenlabs_reachable": is_connected,
             "active_connections": len(active_connections),
-            "connections": [
+            "connections": (
                 {
                     "id": conn_id,
-                    "client_ip": info["client_ip"],
-                    "duration_seconds": (datetime.now() - info["connected_at"]).seconds,
-                    "characters_used": info["characters_used"]
+                    "client_ip": info.client_ip,
+                    "duration_seconds": int(now - info.connected_at),
+                    "characters_used": info.characters_used
                 }
                 for conn_id, info in active_connections.items()
-            ]
+            )
         }
+        return Response(orjson.dumps(payload, default=list), media_type="application/json")
     
     except Exception as e:
         logger.error(f"❌ Voice health check failed: {str(e)}")
@@ -359,10 +619,7 @@ async def voice_stats():
     
     Returns overall usage metrics.
     """
-    total_chars = sum(
-        info["characters_used"]
-        for info in active_connections.values()
-    )
+    total_chars = sum(map(_get_characters_used, active_connections.values()))
     
     total_cost = elevenlabs_service.calculate_cost(total_chars)
     total_minutes = elevenlabs_service.estimate_minutes_from_characters(total_chars)
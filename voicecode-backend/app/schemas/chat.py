@@ -8,7 +8,7 @@ Benefits:
 - Type safety throughout the application
 """
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional
 
 
@@ -24,27 +24,30 @@ class ChatRequest(BaseModel):
         min_length=1,
         max_length=1000,
         description="The user's question or message",
-        example="Why doesn't my code work?"
+        examples=["Why doesn't my code work?"]
     )
     
     code: Optional[str] = Field(
         None,  # Optional - user might not have code yet
         max_length=10000,
-        description="The user's current code",
-        example="def two_sum(nums, target):\n    pass"
+        description=(
+            "The user's current code. Only the first ~2000 and last ~1800 "
+            "characters of code over 4000 characters reach the AI."
+        ),
+        examples=["def two_sum(nums, target):\n    pass"]
     )
     
     problem_id: Optional[str] = Field(
         None,
         max_length=100,
         description="The problem they're working on",
-        example="two-sum"
+        examples=["two-sum"]
     )
     
     language: str = Field(
         default="python",
         description="Programming language",
-        example="python"
+        examples=["python"]
     )
     
     hint_level: int = Field(
@@ -52,20 +55,19 @@ class ChatRequest(BaseModel):
         ge=0,  # Greater than or equal to 0
         le=3,  # Less than or equal to 3
         description="Current hint level (0-3)",
-        example=1
+        examples=[1]
     )
     
-    class Config:
-        # Example for API docs
-        schema_extra = {
-            "example": {
-                "message": "Can you explain how hash maps work?",
-                "code": "def two_sum(nums, target):\n    for i in range(len(nums)):",
-                "problem_id": "two-sum",
-                "language": "python",
-                "hint_level": 0
-            }
+    # Example for API docs
+    model_config = ConfigDict(json_schema_extra={
+        "example": {
+            "message": "Can you explain how hash maps work?",
+            "code": "def two_sum(nums, target):\n    for i in range(len(nums)):",
+            "problem_id": "two-sum",
+            "language": "python",
+            "hint_level": 0
         }
+    })
 
 
 class ChatResponse(BaseModel):
@@ -78,36 +80,35 @@ class ChatResponse(BaseModel):
     response: str = Field(
         ...,
         description="The AI mentor's response",
-        example="Great question! A hash map is a data structure that stores key-value pairs..."
+        examples=["Great question! A hash map is a data structure that stores key-value pairs..."]
     )
     
     tokens_used: Optional[int] = Field(
         None,
         description="Number of tokens consumed (for cost tracking)",
-        example=150
+        examples=[150]
     )
     
     model: str = Field(
         default="gemini-pro",
         description="AI model used",
-        example="gemini-pro"
+        examples=["gemini-pro"]
     )
     
     session_id: Optional[str] = Field(
         None,
         description="Session ID for context caching (if available)",
-        example="550e8400-e29b-41d4-a716-446655440000"
+        examples=["550e8400-e29b-41d4-a716-446655440000"]
     )
     
-    class Config:
-        schema_extra = {
-            "example": {
-                "response": "I see you're working on Two Sum. Let me guide you: What data structure offers O(1) lookup time?",
-                "tokens_used": 45,
-                "model": "gemini-pro",
-                "session_id": "550e8400-e29b-41d4-a716-446655440000"
-            }
+    model_config = ConfigDict(json_schema_extra={
+        "example": {
+            "response": "I see you're working on Two Sum. Let me guide you: What data structure offers O(1) lookup time?",
+            "tokens_used": 45,
+            "model": "gemini-pro",
+            "session_id": "550e8400-e29b-41d4-a716-446655440000"
         }
+    })
 
 
 class ErrorResponse(BaseModel):
@@ -118,18 +119,18 @@ class ErrorResponse(BaseModel):
     error: str = Field(
         ...,
         description="Error type",
-        example="rate_limit_exceeded"
+        examples=["rate_limit_exceeded"]
     )
     
     message: str = Field(
         ...,
         description="Human-readable error message",
-        example="You've exceeded the rate limit. Please wait before trying again."
+        examples=["You've exceeded the rate limit. Please wait before trying again."]
     )
     
     retry_after: Optional[int] = Field(
         None,
         description="Seconds to wait before retrying",
-        example=60
+        examples=[60]
     )
 
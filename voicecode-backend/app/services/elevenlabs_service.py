@@ -15,9 +15,10 @@ This service acts as a secure proxy between frontend and ElevenLabs.
 
 import asyncio
 import logging
-from typing import Optional, Callable
-import httpx
-from app.config import settings
+import ssl
+from types import MappingProxyType
+from typing import Mapping, Optional
+from app.config import get_settings, get_secret, aget_secret
 
 logger = logging.getLogger(__name__)
 
@@ -40,27 +41,65 @@ class ElevenLabsService:
         Initialize ElevenLabs service.
         
         Configuration loaded from settings (API key from .env or Secret Manager).
+        Secret Manager lookups are deferred until the key is first used.
         """
-        self.api_key = settings.ELEVENLABS_API_KEY
-        self.agent_id = settings.ELEVENLABS_AGENT_ID
+        settings = get_settings()
         self.base_url = "wss://api.elevenlabs.io/v1/convai/conversation"
         
-        # Validate configuration
-        if not self.api_key:
-            logger.warning(
-                "⚠️ ELEVENLABS_API_KEY not configured. "
-                "Voice features will not work."
-            )
-        
-        if not self.agent_id:
-            logger.warning(
-                "⚠️ ELEVENLABS_AGENT_ID not configured. "
-                "Voice features will not work."
-            )
+        # One TLS context for every ElevenLabs connection, so the CA bundle
+        # is loaded once per worker instead of on each websockets.connect
+        self.ssl_context = ssl.create_default_context()
+        
+        # Connection URL and auth headers, built once the secrets resolve
+        self._url: Optional[str] = None
+        self._headers: Optional[Mapping[str, str]] = None
+        
+        # Validate configuration (only possible up front without Secret Manager)
+        if not settings.USE_SECRET_MANAGER:
+            if not settings.ELEVENLABS_API_KEY:
+                logger.warning(
+                    "⚠️ ELEVENLABS_API_KEY not configured. "
+                    "Voice features will not work."
+                )
+            
+            if not settings.ELEVENLABS_AGENT_ID:
+                logger.warning(
+                    "⚠️ ELEVENLABS_AGENT_ID not configured. "
+                    "Voice features will not work."
+                )
         
         logger.info("✅ ElevenLabs service initialized")
     
     
+    @property
+    def api_key(self) -> Optional[str]:
+        """ElevenLabs API key (blocking on first access; see load_credentials)"""
+        return get_secret("ELEVENLABS_API_KEY")
+    
+    
+    @property
+    def agent_id(self) -> Optional[str]:
+        """ElevenLabs agent ID (blocking on first access; see load_credentials)"""
+        return get_secret("ELEVENLABS_AGENT_ID")
+    
+    
+    async def load_credentials(self) -> tuple[Optional[str], Optional[str]]:
+        """
+        Resolve the API key and agent ID without blocking the event loop.
+        
+        Once this returns, api_key / agent_id and the URL/header builders
+        are served from the secret cache.
+        
+        Returns:
+            Tuple of (api_key, agent_id)
+        """
+        api_key, agent_id = await asyncio.gather(
+            aget_secret("ELEVENLABS_API_KEY"),
+            aget_secret("ELEVENLABS_AGENT_ID")
+        )
+        return api_key, agent_id
+    
+    
     def get_connection_url(self) -> str:
         """
         Build WebSocket URL for ElevenLabs connection.
@@ -71,21 +110,35 @@ class ElevenLabsService:
         Returns:
             WebSocket URL with agent ID and API key in query params
         """
-        return f"{self.base_url}?agent_id={self.agent_id}"
+        if self._url is not None:
+            return self._url
+        
+        agent_id = self.agent_id
+        url = f"{self.base_url}?agent_id={agent_id}"
+        if agent_id:
+            # Only cache once the secret has actually resolved
+            self._url = url
+        return url
     
     
-    def get_auth_headers(self) -> dict:
+    def get_auth_headers(self) -> Mapping[str, str]:
         """
         Build authentication headers for ElevenLabs API.
         
         API key is sent in the xi-api-key header.
         
         Returns:
-            Dictionary of HTTP headers
+            Read-only mapping of HTTP headers (shared between calls)
         """
-        return {
-            "xi-api-key": self.api_key,
-        }
+        if self._headers is not None:
+            return self._headers
+        
+        api_key = self.api_key
+        headers = MappingProxyType({"xi-api-key": api_key})
+        if api_key:
+            # Only cache once the secret has actually resolved
+            self._headers = headers
+        return headers
     
     
     async def validate_connection(self) -> bool:
@@ -99,7 +152,8 @@ class ElevenLabsService:
         Returns:
             True if API key and agent ID are configured
         """
-        is_configured = bool(self.api_key and self.agent_id)
+        api_key, agent_id = await self.load_credentials()
+        is_configured = bool(api_key and agent_id)
         
         if is_configured:
             logger.info("✅ ElevenLabs credentials configured")
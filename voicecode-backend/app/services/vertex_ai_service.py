@@ -10,14 +10,109 @@ Why Vertex AI instead of Gemini API directly?
 - Enterprise features available
 """
 
-import google.generativeai as genai
-from google.generativeai.types import HarmCategory, HarmBlockThreshold
-from app.config import settings
+from google import genai
+from google.genai import types
+from app.config import get_secret
+from collections import OrderedDict
+from contextlib import aclosing
+import asyncio
+import hashlib
+import httpx
 import logging
+import re
+import time
 from typing import Optional
 
 logger = logging.getLogger(__name__)
 
+# gemini-2.5-flash: Best price-performance, free tier available
+# gemini-2.5-pro: More capable but requires paid plan
+MODEL_NAME = 'gemini-2.5-flash'
+
+# Response cache: an identical context (same problem, code, hint level and
+# question) reuses the earlier answer instead of another Gemini round-trip
+RESPONSE_CACHE_SIZE = 2000
+RESPONSE_CACHE_TTL_SECONDS = 3600
+
+# Max Gemini calls in flight per worker (extra requests wait their turn
+# instead of piling onto the API and tripping its 429s)
+MAX_CONCURRENT_REQUESTS = 20
+
+# Longest code snippet embedded in a prompt; longer code keeps its
+# beginning and end with a marker in between
+MAX_PROMPT_CODE_CHARS = 4000
+_CODE_HEAD_CHARS = 2000
+_CODE_TAIL_CHARS = 1800
+
+# Per-request context sections (user text is only ever a format argument,
+# so braces in code or questions are safe)
+_PROBLEM_SECTION = "\nStudent is working on: {problem_id}\n"
+_CODE_SECTION = "\nStudent's current code:\n```\n{code}\n```\n"
+_HINT_SECTION = (
+    "\nHints already given: {hint_level}/3\n"
+    "Build on previous hints. Don't repeat what they already know.\n"
+)
+_QUESTION_SECTION = (
+    "\nStudent's question: {user_message}\n"
+    "\nRespond as a Socratic mentor. Guide, don't solve."
+)
+
+# One prebuilt template per combination of sections, indexed by
+# (has_problem << 2) | (has_code << 1) | (has_hints)
+_CONTEXT_TEMPLATES = tuple(
+    (_PROBLEM_SECTION if key & 4 else "")
+    + (_CODE_SECTION if key & 2 else "")
+    + (_HINT_SECTION if key & 1 else "")
+    + _QUESTION_SECTION
+    for key in range(8)
+)
+
+# Appended to the context when a response has to be regenerated
+RETRY_INSTRUCTION = (
+    "\n\nYour last answer contained code or gave the solution away. "
+    "Respond with only a single guiding question."
+)
+
+# Code blocks and common "giving away the answer" phrases
+_GIVEAWAY_RE = re.compile(
+    r"```(?:python|javascript)"
+    r"|here's the complete solution"
+    r"|here's the full code"
+    r"|copy this code"
+    r"|the answer is",
+    re.IGNORECASE
+)
+
+# System instruction (defines mentor personality); the same for every request
+SYSTEM_PROMPT = """You are a Socratic coding mentor helping students learn data structures and algorithms.
+
+CRITICAL RULES:
+1. NEVER give complete solutions or full code
+2. Guide with questions, not answers
+3. Reference specific parts of their code when relevant
+4. Keep responses concise (2-3 sentences)
+5. Encourage thinking about time/space complexity
+
+Teaching style: Socratic method
+- Ask probing questions
+- Build on student's existing knowledge
+- Let them discover the solution
+
+"""
+
+
+def _trim_code(code: str) -> str:
+    """
+    Bound the size of the code pasted into a prompt.
+    
+    Trailing whitespace is stripped from every line; code still longer than
+    MAX_PROMPT_CODE_CHARS keeps its head and tail around an elision marker.
+    """
+    code = "\n".join(line.rstrip() for line in code.splitlines())
+    if len(code) <= MAX_PROMPT_CODE_CHARS:
+        return code
+    return code[:_CODE_HEAD_CHARS] + "\n... [truncated] ...\n" + code[-_CODE_TAIL_CHARS:]
+
 
 class VertexAIService:
     """
@@ -40,28 +135,48 @@ class VertexAIService:
             # Configure API key
             # In production, this comes from Secret Manager
             # For now, from .env file
-            genai.configure(api_key=settings.GEMINI_API_KEY)
+            # The client exposes an async API (client.aio) so Gemini calls
+            # don't block the event loop. One long-lived client per worker
+            # keeps a pooled HTTP/2 connection, so requests skip the TLS
+            # handshake and share the connection.
+            self.client = genai.Client(
+                api_key=get_secret("GEMINI_API_KEY"),
+                http_options=types.HttpOptions(
+                    async_client_args={
+                        "http2": True,
+                        "limits": httpx.Limits(max_connections=100, max_keepalive_connections=20),
+                    }
+                )
+            )
+            self.model = MODEL_NAME
             
-            # Initialize model
-            # gemini-2.5-flash: Best price-performance, free tier available
-            # gemini-2.5-pro: More capable but requires paid plan
-            self.model = genai.GenerativeModel(
-                model_name='gemini-2.5-flash',
-                generation_config={
-                    'temperature': 0.7,      # Creativity (0=deterministic, 1=creative)
-                    'top_p': 0.8,            # Nucleus sampling
-                    'top_k': 40,             # Top-k sampling
-                    'max_output_tokens': 500, # Limit response length
-                },
-                safety_settings={
+            # Per-call config, built once and reused for every request
+            self.generation_config = types.GenerateContentConfig(
+                temperature=0.7,         # Creativity (0=deterministic, 1=creative)
+                top_p=0.8,               # Nucleus sampling
+                top_k=40,                # Top-k sampling
+                max_output_tokens=500,   # Limit response length
+                # Sent as the system instruction rather than pasted into
+                # each prompt: an identical prefix on every request, which
+                # Gemini's implicit prefix caching can reuse
+                system_instruction=SYSTEM_PROMPT,
+                safety_settings=[
                     # Relax safety filters for educational content
-                    HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-                    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-                    HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-                    HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-                }
+                    types.SafetySetting(category=category, threshold=types.HarmBlockThreshold.BLOCK_NONE)
+                    for category in (
+                        types.HarmCategory.HARM_CATEGORY_HARASSMENT,
+                        types.HarmCategory.HARM_CATEGORY_HATE_SPEECH,
+                        types.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT,
+                        types.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT,
+                    )
+                ]
             )
             
+            # context digest -> (expires_at, result), oldest first
+            self._response_cache: OrderedDict[bytes, tuple[float, dict]] = OrderedDict()
+            
+            self._semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+            
             logger.info("✅ Vertex AI (Gemini) service initialized")
             
         except Exception as e:
@@ -91,46 +206,22 @@ class VertexAIService:
             hint_level: How many hints they've seen (0-3)
         
         Returns:
-            Formatted context string for Gemini
+            Formatted context string for Gemini (the system prompt is
+            sent separately, see generation_config)
         """
         
-        # Start with system instruction (defines mentor personality)
-        context = """You are a Socratic coding mentor helping students learn data structures and algorithms.
-
-CRITICAL RULES:
-1. NEVER give complete solutions or full code
-2. Guide with questions, not answers
-3. Reference specific parts of their code when relevant
-4. Keep responses concise (2-3 sentences)
-5. Encourage thinking about time/space complexity
-
-Teaching style: Socratic method
-- Ask probing questions
-- Build on student's existing knowledge
-- Let them discover the solution
-
-"""
-        
-        # Add problem context if available
-        if problem_id:
-            context += f"\nStudent is working on: {problem_id}\n"
-        
-        # Add code context if available
+        # Only the parts that change per request, from the template for
+        # this combination of problem / code / hints
+        key = (bool(problem_id) << 2) | (bool(code) << 1) | (hint_level > 0)
         if code:
-            context += f"\nStudent's current code:\n```\n{code}\n```\n"
-        
-        # Add hint level context
-        if hint_level > 0:
-            context += f"\nHints already given: {hint_level}/3\n"
-            context += "Build on previous hints. Don't repeat what they already know.\n"
+            code = _trim_code(code)
         
-        # Add the actual user question
-        context += f"\nStudent's question: {user_message}\n"
-        
-        # Final reminder
-        context += "\nRespond as a Socratic mentor. Guide, don't solve."
-        
-        return context
+        return _CONTEXT_TEMPLATES[key].format(
+            problem_id=problem_id,
+            code=code,
+            hint_level=hint_level,
+            user_message=user_message
+        )
     
     
     async def generate_response(
@@ -171,26 +262,40 @@ Teaching style: Socratic method
                 hint_level=hint_level
             )
             
+            cache_key = hashlib.blake2b(context.encode(), digest_size=16).digest()
+            cached = self._get_cached_response(cache_key)
+            if cached is not None:
+                logger.info("✅ Gemini response served from cache")
+                # Nothing was spent on this one
+                return {**cached, "tokens_used": 0}
+            
             logger.debug(f"Sending to Gemini (context length: {len(context)} chars)")
             
-            # Call Gemini API
-            response = self.model.generate_content(context)
+            # Call Gemini API (streamed, so a response that gives the
+            # answer away is cut off early and regenerated)
+            response_text, usage = await self._generate_validated(context)
             
-            # Extract response text
-            response_text = response.text
+            # Empty if the response was blocked
+            if not response_text:
+                raise ValueError("Gemini returned no text")
             
-            # Count tokens (approximate)
-            # Gemini API doesn't return exact count, so we estimate
-            # Average: 1 token ≈ 4 characters
-            tokens_used = len(context + response_text) // 4
+            # Count tokens
+            # Use the exact count Gemini reports; if it's missing, estimate
+            # ~3 characters per token (code tokenizes denser than prose)
+            if usage is not None and usage.total_token_count:
+                tokens_used = usage.total_token_count
+            else:
+                tokens_used = (len(SYSTEM_PROMPT) + len(context) + len(response_text)) // 3
             
             logger.info(f"✅ Gemini response generated (~{tokens_used} tokens)")
             
-            return {
+            result = {
                 "response": response_text,
                 "tokens_used": tokens_used,
-                "model": "gemini-2.5-flash"
+                "model": self.model
             }
+            self._cache_response(cache_key, result)
+            return result
             
         except Exception as e:
             logger.error(f"❌ Gemini API error: {str(e)}")
@@ -202,6 +307,96 @@ Teaching style: Socratic method
             )
     
     
+    async def _generate_validated(self, context: str) -> tuple[str, Optional[types.GenerateContentResponseUsageMetadata]]:
+        """
+        Stream a response, regenerating it once if it gives the answer away.
+        
+        The first attempt is checked with validate_response as chunks
+        arrive and abandoned as soon as it fails, instead of paying for
+        the rest of it. The retry adds a stricter instruction and is
+        returned as is.
+        
+        Returns:
+            (response_text, usage_metadata)
+        """
+        response_text, usage, is_valid = await self._stream_response(context, validate=True)
+        if is_valid:
+            return response_text, usage
+        
+        logger.warning("⚠️ Regenerating AI response with stricter instructions")
+        response_text, usage, _ = await self._stream_response(context + RETRY_INSTRUCTION, validate=False)
+        return response_text, usage
+    
+    
+    async def _stream_response(self, contents: str, validate: bool):
+        """
+        Stream one Gemini response.
+        
+        Returns:
+            (response_text, usage_metadata, is_valid); the text is empty
+            when validation stopped the stream early
+        """
+        chunks = []
+        usage = None
+        
+        async with self._semaphore:
+            stream = await self.client.aio.models.generate_content_stream(
+                model=self.model,
+                contents=contents,
+                config=self.generation_config
+            )
+            async with aclosing(stream):
+                async for chunk in stream:
+                    if chunk.usage_metadata is not None:
+                        usage = chunk.usage_metadata
+                    if not chunk.text:
+                        continue
+                    
+                    chunks.append(chunk.text)
+                    if validate and not self.validate_response("".join(chunks)):
+                        return "", usage, False
+        
+        return "".join(chunks), usage, True
+    
+    
+    async def generate_responses_batch(self, prompts: list[dict]) -> list[dict]:
+        """
+        Generate several responses concurrently.
+        
+        Args:
+            prompts: generate_response keyword arguments, one dict per prompt
+        
+        Returns:
+            Results in the same order as prompts
+        """
+        return await asyncio.gather(
+            *(self.generate_response(**prompt) for prompt in prompts)
+        )
+    
+    
+    def _get_cached_response(self, key: bytes) -> Optional[dict]:
+        """Return a cached result for this context digest, if still fresh"""
+        entry = self._response_cache.get(key)
+        if entry is None:
+            return None
+        
+        expires_at, result = entry
+        if expires_at < time.monotonic():
+            del self._response_cache[key]
+            return None
+        
+        self._response_cache.move_to_end(key)
+        return result
+    
+    
+    def _cache_response(self, key: bytes, result: dict) -> None:
+        """Store a result, evicting the least recently used past the cap"""
+        self._response_cache[key] = (time.monotonic() + RESPONSE_CACHE_TTL_SECONDS, result)
+        self._response_cache.move_to_end(key)
+        while len(self._response_cache) > RESPONSE_CACHE_SIZE:
+            self._response_cache.popitem(last=False)
+    
+    
     def validate_response(self, response_text: str) -> bool:
         """
         Check if the AI response is appropriate.
@@ -216,26 +411,17 @@ Teaching style: Socratic method
             True if response is appropriate, False if it contains full code
         """
         
-        # Check for code blocks (might be full solution)
-        if "```python" in response_text or "```javascript" in response_text:
-            # Count lines of code
-            code_lines = response_text.count('\n')
-            if code_lines > 5:
-                logger.warning("⚠️ AI response contains too much code, filtering")
-                return False
-        
-        # Check for common "giving away the answer" phrases
-        giveaway_phrases = [
-            "here's the complete solution",
-            "here's the full code",
-            "copy this code",
-            "the answer is",
-        ]
-        
-        for phrase in giveaway_phrases:
-            if phrase in response_text.lower():
-                logger.warning(f"⚠️ AI response contains giveaway phrase: {phrase}")
-                return False
+        # One pass finds both code blocks and "giving away the answer" phrases
+        for match in _GIVEAWAY_RE.finditer(response_text):
+            if match.group(0).startswith("```"):
+                # Code block (might be full solution): count lines of code
+                if response_text.count('\n') > 5:
+                    logger.warning("⚠️ AI response contains too much code, filtering")
+                    return False
+                continue
+            
+            logger.warning(f"⚠️ AI response contains giveaway phrase: {match.group(0).lower()}")
+            return False
         
         return True
 
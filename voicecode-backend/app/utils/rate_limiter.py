@@ -4,53 +4,145 @@ Simple Rate Limiter - IP-based Request Limiting
 Prevents API abuse without requiring user authentication.
 
 How it works:
-- Tracks requests per IP address
-- Rejects requests if limit exceeded
+- Token bucket per IP address (max_requests tokens, refilled evenly
+  over window_seconds), stored as a single timestamp (GCRA)
+- Each request spends one token; requests with no token left are rejected
 - Uses in-memory storage (resets on server restart)
+- With REDIS_URL set, counts are kept in Redis instead (fixed window,
+  INCR + EXPIRE), so limits hold across workers and servers; if Redis
+  is unreachable we fall back to the in-memory bucket
 
 Limitations (acceptable for MVP):
-- Not distributed (won't work with multiple servers)
-- Resets on restart
+- In-memory mode is per worker and resets on restart
 - Can be bypassed with VPN/proxy
 
 For production with auth:
-- Use Redis for distributed rate limiting
 - Rate limit by user ID instead of IP
-- Implement token bucket algorithm
 """
 
+from collections import OrderedDict
 from fastapi import HTTPException, Request
-from functools import wraps
-from datetime import datetime, timedelta
-from collections import defaultdict
+from app.config import get_settings
+import asyncio
+import hashlib
 import logging
+import math
+import time
+
+# How long to stay on the in-memory fallback after a Redis error
+REDIS_RETRY_SECONDS = 30
+
+# How often the background reaper drops idle buckets
+CLEANUP_INTERVAL_SECONDS = 60
+
+# Hard cap on clients tracked per limit (e.g. a flood of spoofed IPs):
+# past it, the least recently seen client is evicted in O(1)
+MAX_TRACKED_CLIENTS = 100_000
 
 logger = logging.getLogger(__name__)
 
 
 class SimpleRateLimiter:
     """
-    In-memory rate limiter using sliding window.
+    In-memory rate limiter using a token bucket.
     
-    Tracks requests per IP address in a time window.
+    The bucket is kept as one float per IP address, its "theoretical
+    arrival time" (GCRA): the moment the bucket would be full again.
+    Each request pushes it forward by window_seconds / max_requests; a
+    request is rejected if that would put it more than a full window
+    ahead of now. Same behavior as counting tokens, with half the state.
     """
     
     def __init__(self):
         """
         Initialize rate limiter.
         
-        Data structure:
+        Data structure (monotonic clock timestamps), one table per limit:
         {
-            "192.168.1.1": [timestamp1, timestamp2, timestamp3],
-            "10.0.0.1": [timestamp1]
+            (max_requests, window_seconds): {
+                "192.168.1.1": bucket_full_at,
+                "10.0.0.1": 12345.67
+            }
         }
         """
-        # Dictionary to store request timestamps per IP
-        self.requests = defaultdict(list)
+        # Bucket state per IP, kept separately for each limit so endpoints
+        # with different limits don't share (and mis-size) one bucket.
+        # Ordered least to most recently seen, so eviction pops the front.
+        self.buckets: dict[tuple[int, int], OrderedDict[str, float]] = {}
+        
+        # Optional shared store (client created on first use)
+        self.redis_url = get_settings().REDIS_URL
+        self._redis = None
+        self._redis_retry_at = 0.0
+    
+    
+    async def check(
+        self,
+        identifier: str,
+        max_requests: int = 10,
+        window_seconds: int = 60
+    ) -> tuple[bool, int]:
+        """
+        Check the rate limit, using Redis when configured.
+        
+        Same arguments and return value as check_rate_limit, which is
+        used directly without Redis or while Redis is unavailable.
+        """
+        if self.redis_url and time.monotonic() >= self._redis_retry_at:
+            try:
+                return await self._check_redis(identifier, max_requests, window_seconds)
+            except Exception as e:
+                self._redis_retry_at = time.monotonic() + REDIS_RETRY_SECONDS
+                logger.warning(f"⚠️ Redis rate limiting unavailable, using in-memory limits: {e}")
+        
+        return self.check_rate_limit(identifier, max_requests, window_seconds)
+    
+    
+    async def _check_redis(
+        self,
+        identifier: str,
+        max_requests: int,
+        window_seconds: int
+    ) -> tuple[bool, int]:
+        """
+        Fixed-window counter in Redis: one INCR + EXPIRE round trip.
+        
+        Uses wall-clock time so every server agrees on window boundaries.
+        """
+        if self._redis is None:
+            # Only needed when REDIS_URL is set
+            import redis.asyncio as redis
+            self._redis = redis.from_url(
+                self.redis_url,
+                max_connections=50,
+                socket_timeout=0.5,
+                socket_connect_timeout=0.5
+            )
+        
+        now = time.time()
+        window_id = int(now // window_seconds)
+        # Fixed-size binary key: short on the wire whatever the identifier
+        key = b"rl:" + hashlib.blake2b(
+            f"{identifier}|{max_requests}|{window_seconds}|{window_id}".encode(),
+            digest_size=16
+        ).digest()
+        
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.incr(key)
+            pipe.expire(key, window_seconds)
+            count, _ = await pipe.execute()
+        
+        if count > max_requests:
+            retry_after = math.ceil((window_id + 1) * window_seconds - now)
+            
+            logger.warning(
+                f"⚠️ Rate limit exceeded for {identifier}: "
+                f"{max_requests} per {window_seconds}s"
+            )
+            
+            return False, retry_after
         
-        # Clean up old entries every 100 requests
-        self.request_count = 0
-        self.cleanup_threshold = 100
+        return True, 0
     
     
     def check_rate_limit(
@@ -64,76 +156,94 @@ class SimpleRateLimiter:
         
         Args:
             identifier: IP address or user ID
-            max_requests: Maximum requests allowed
-            window_seconds: Time window in seconds
+            max_requests: Maximum requests allowed (bucket capacity)
+            window_seconds: Time to refill an empty bucket
         
         Returns:
             Tuple of (is_allowed, retry_after_seconds)
             - (True, 0): Request allowed
-            - (False, 45): Rate limited, retry after 45 seconds
+            - (False, 6): Rate limited, retry after 6 seconds
         """
         
-        now = datetime.now()
-        window_start = now - timedelta(seconds=window_seconds)
+        now = time.monotonic()
+        interval = window_seconds / max_requests  # seconds per token
         
-        # Get requests for this identifier
-        request_times = self.requests[identifier]
+        limit_key = (max_requests, window_seconds)
+        buckets = self.buckets.get(limit_key)
+        if buckets is None:
+            buckets = self.buckets[limit_key] = OrderedDict()
         
-        # Remove old requests (outside the window)
-        # Only keep requests within the last 60 seconds (or whatever window)
-        recent_requests = [
-            req_time for req_time in request_times
-            if req_time > window_start
-        ]
+        # When the bucket will be full again (now, if it already is)
+        full_at = buckets.get(identifier)
+        if full_at is None:
+            full_at = now
+        else:
+            buckets.move_to_end(identifier)
+            if full_at < now:
+                full_at = now
         
-        # Update stored requests
-        self.requests[identifier] = recent_requests
-        
-        # Check if limit exceeded
-        if len(recent_requests) >= max_requests:
-            # Calculate how long to wait
-            oldest_request = min(recent_requests)
-            retry_after = (oldest_request + timedelta(seconds=window_seconds) - now).seconds
+        # Check if limit exceeded: spending a token would leave the bucket
+        # more than a full window from refilled (nothing is stored)
+        # (the tolerance absorbs float rounding in the summed intervals)
+        overdraft = full_at + interval - now - window_seconds
+        if overdraft > 1e-9:
+            # Calculate how long until the next token
+            retry_after = math.ceil(overdraft)
             
             logger.warning(
                 f"⚠️ Rate limit exceeded for {identifier}: "
-                f"{len(recent_requests)}/{max_requests} in {window_seconds}s"
+                f"{max_requests} per {window_seconds}s"
             )
             
             return False, retry_after
         
-        # Add current request
-        recent_requests.append(now)
-        self.requests[identifier] = recent_requests
+        # Spend a token for the current request
+        buckets[identifier] = full_at + interval
         
-        # Periodic cleanup
-        self.request_count += 1
-        if self.request_count >= self.cleanup_threshold:
-            self._cleanup_old_entries(window_start)
-            self.request_count = 0
+        # Enforce the cap without scanning: evict the least recently seen
+        # client (worst case it gets a fresh bucket on its next request)
+        if len(buckets) > MAX_TRACKED_CLIENTS:
+            buckets.popitem(last=False)
         
         return True, 0
     
     
-    def _cleanup_old_entries(self, cutoff_time: datetime):
+    async def reaper(self):
         """
-        Remove entries with no recent requests.
+        Drop idle buckets every CLEANUP_INTERVAL_SECONDS.
         
-        Prevents memory from growing indefinitely.
+        Runs as a background task (started in the app lifespan) so the
+        cleanup scan never lands on a request's admission path.
+        """
+        while True:
+            await asyncio.sleep(CLEANUP_INTERVAL_SECONDS)
+            self._cleanup_old_entries(time.monotonic())
+    
+    
+    def _cleanup_old_entries(self, now: float):
         """
-        # Find identifiers with no recent requests
-        to_remove = [
-            identifier
-            for identifier, request_times in self.requests.items()
-            if not request_times or max(request_times) < cutoff_time
-        ]
-        
-        # Remove them
-        for identifier in to_remove:
-            del self.requests[identifier]
-        
-        if to_remove:
-            logger.debug(f"🧹 Cleaned up {len(to_remove)} old rate limit entries")
+        Remove buckets that have refilled completely.
+        
+        A full bucket behaves exactly like a missing one, so dropping it
+        doesn't change behavior. Prevents memory from growing
+        indefinitely.
+        """
+        removed = 0
+        for buckets in self.buckets.values():
+            # Find identifiers with no recent requests
+            to_remove = [
+                identifier
+                for identifier, full_at in buckets.items()
+                if full_at <= now
+            ]
+            
+            # Remove them
+            for identifier in to_remove:
+                del buckets[identifier]
+            removed += len(to_remove)
+        
+        if removed:
+            logger.debug(f"🧹 Cleaned up {removed} old rate limit entries")
 
 
 # Create singleton instance
@@ -142,12 +252,17 @@ rate_limiter = SimpleRateLimiter()
 
 def rate_limit(max_requests: int = 10, window_seconds: int = 60):
     """
-    Decorator for rate limiting endpoints.
+    Build a FastAPI dependency that rate limits an endpoint.
+    
+    FastAPI injects the Request directly, so there's no scanning of the
+    endpoint's arguments on each call.
     
     Usage:
-        @router.post("/api/chat")
-        @rate_limit(max_requests=10, window_seconds=60)
-        async def chat(request: Request, ...):
+        @router.post(
+            "/api/chat",
+            dependencies=[Depends(rate_limit(max_requests=10, window_seconds=60))]
+        )
+        async def chat(...):
             ...
     
     Args:
@@ -155,59 +270,26 @@ def rate_limit(max_requests: int = 10, window_seconds: int = 60):
         window_seconds: Time window in seconds
     """
     
-    def decorator(func):
-        @wraps(func)
-        async def wrapper(*args, **kwargs):
-            # Find the Request object in args or kwargs
-            request = None
-            
-            # Check args
-            for arg in args:
-                if isinstance(arg, Request):
-                    request = arg
-                    break
-            
-            # Check kwargs
-            if not request and 'request' in kwargs:
-                request = kwargs['request']
-            
-            if not request:
-                # No Request object found, skip rate limiting
-                logger.warning("⚠️ Rate limit decorator: No Request object found")
-                return await func(*args, **kwargs)
-            
-            # Get client IP
-            # Try X-Forwarded-For first (if behind proxy/load balancer)
-            client_ip = request.headers.get('X-Forwarded-For')
-            if client_ip:
-                # X-Forwarded-For can be comma-separated list
-                client_ip = client_ip.split(',')[0].strip()
-            else:
-                # Fallback to direct client IP
-                client_ip = request.client.host if request.client else "unknown"
-            
-            # Check rate limit
-            is_allowed, retry_after = rate_limiter.check_rate_limit(
-                identifier=client_ip,
-                max_requests=max_requests,
-                window_seconds=window_seconds
-            )
-            
-            if not is_allowed:
-                # Rate limit exceeded
-                raise HTTPException(
-                    status_code=429,
-                    detail={
-                        "error": "rate_limit_exceeded",
-                        "message": f"Too many requests. Please wait {retry_after} seconds.",
-                        "retry_after": retry_after
-                    }
-                )
-            
-            # Call the actual endpoint function
-            return await func(*args, **kwargs)
+    async def check_rate_limit(request: Request) -> None:
+        # Get client IP (resolved once by ClientIPMiddleware)
+        client_ip = request.state.client_ip
         
-        return wrapper
+        # Check rate limit
+        is_allowed, retry_after = await rate_limiter.check(
+            identifier=client_ip,
+            max_requests=max_requests,
+            window_seconds=window_seconds
+        )
+        
+        if not is_allowed:
+            # Rate limit exceeded
+            raise HTTPException(
+                status_code=429,
+                detail={
+                    "error": "rate_limit_exceeded",
+                    "message": f"Too many requests. Please wait {retry_after} seconds.",
+                    "retry_after": retry_after
+                }
+            )
     
-    return decorator
-
+    return check_rate_limit
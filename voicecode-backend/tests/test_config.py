@@ -0,0 +1,66 @@
+"""
+Tests for Secret Manager lookups in app.config
+"""
+
+import pytest
+
+from app import config
+
+
+class FakeSecretClient:
+    def __init__(self, payloads):
+        self.payloads = payloads
+        self.calls = 0
+    
+    def access_secret_version(self, name):
+        self.calls += 1
+        payload = self.payloads.get(name.split("/")[3])
+        if payload is None:
+            raise RuntimeError("secret not found")
+        
+        class Response:
+            class payload:
+                data = payload.encode()
+        return Response
+
+
+@pytest.fixture
+def secret_client(monkeypatch):
+    monkeypatch.setenv("USE_SECRET_MANAGER", "true")
+    monkeypatch.delenv("ELEVENLABS_API_KEY", raising=False)
+    monkeypatch.delenv("ELEVENLABS_AGENT_ID", raising=False)
+    config.get_settings.cache_clear()
+    monkeypatch.setattr(config, "_secret_cache", {})
+    
+    client = FakeSecretClient({"ELEVENLABS_API_KEY": "xi-key"})
+    monkeypatch.setattr(config, "_get_secret_client", lambda: client)
+    yield client
+    config.get_settings.cache_clear()
+
+
+def test_found_secret_is_cached(secret_client):
+    assert config.get_secret("ELEVENLABS_API_KEY") == "xi-key"
+    assert config.get_secret("ELEVENLABS_API_KEY") == "xi-key"
+    assert secret_client.calls == 1
+
+
+def test_missing_secret_is_cached(secret_client):
+    assert config.get_secret("ELEVENLABS_AGENT_ID") is None
+    assert config.get_secret("ELEVENLABS_AGENT_ID") is None
+    assert secret_client.calls == 1
+
+
+def test_missing_secret_is_retried_after_ttl(secret_client, monkeypatch):
+    monkeypatch.setattr(config, "SECRET_RETRY_SECONDS", 0)
+    assert config.get_secret("ELEVENLABS_AGENT_ID") is None
+    
+    secret_client.payloads["ELEVENLABS_AGENT_ID"] = "agent"
+    assert config.get_secret("ELEVENLABS_AGENT_ID") == "agent"
+    assert secret_client.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_aget_secret(secret_client):
+    assert await config.aget_secret("ELEVENLABS_API_KEY") == "xi-key"
+    assert await config.aget_secret("ELEVENLABS_API_KEY") == "xi-key"
+    assert secret_client.calls == 1
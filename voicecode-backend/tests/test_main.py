@@ -0,0 +1,37 @@
+"""
+Tests for API readiness handling in app.main
+"""
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+ORIGIN = "http://localhost:5173"
+
+
+def test_unloaded_api_gets_503_with_cors_headers():
+    # No lifespan: the routers never load
+    client = TestClient(app)
+    
+    response = client.get("/api/chat/health", headers={"Origin": ORIGIN})
+    assert response.status_code == 503
+    assert response.headers["access-control-allow-origin"] == ORIGIN
+
+
+def test_preflight_is_not_held():
+    client = TestClient(app)
+    
+    response = client.options("/api/chat", headers={
+        "Origin": ORIGIN,
+        "Access-Control-Request-Method": "POST",
+    })
+    assert response.status_code == 200
+    assert response.headers["access-control-allow-origin"] == ORIGIN
+
+
+def test_app_api_routes_skip_the_router_wait():
+    client = TestClient(app)
+    
+    assert client.get("/api/info").status_code == 200
+    assert client.get("/api/docs").status_code == 200
+    assert client.get("/api/redoc").status_code == 200
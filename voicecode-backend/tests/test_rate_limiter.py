@@ -0,0 +1,52 @@
+"""
+Tests for the in-memory rate limiter
+"""
+
+import pytest
+
+from app.utils import rate_limiter as rl
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    monkeypatch.setattr(rl, "MAX_TRACKED_CLIENTS", 100)
+    return rl.SimpleRateLimiter()
+
+
+def test_limits_after_max_requests(limiter):
+    for _ in range(3):
+        assert limiter.check_rate_limit("1.2.3.4", 3, 60) == (True, 0)
+    
+    allowed, retry_after = limiter.check_rate_limit("1.2.3.4", 3, 60)
+    assert not allowed
+    assert retry_after > 0
+
+
+def test_table_is_capped_without_full_scans(limiter, monkeypatch):
+    def full_scan(now):
+        raise AssertionError("full cleanup scan on the request path")
+    monkeypatch.setattr(limiter, "_cleanup_old_entries", full_scan)
+    
+    # Flood of distinct (spoofed) clients, well past the cap
+    for i in range(1000):
+        assert limiter.check_rate_limit(f"10.0.{i // 256}.{i % 256}", 10, 60)[0]
+    
+    buckets = limiter.buckets[(10, 60)]
+    assert len(buckets) == rl.MAX_TRACKED_CLIENTS
+    # The most recent clients are the ones kept
+    assert "10.0.3.231" in buckets
+    assert "10.0.0.0" not in buckets
+
+
+def test_eviction_prefers_idle_clients(limiter):
+    limiter.check_rate_limit("active", 10, 60)
+    for i in range(rl.MAX_TRACKED_CLIENTS - 1):
+        limiter.check_rate_limit(f"idle-{i}", 10, 60)
+    
+    # Seeing "active" again moves it to the back of the eviction order
+    limiter.check_rate_limit("active", 10, 60)
+    limiter.check_rate_limit("newcomer", 10, 60)
+    
+    buckets = limiter.buckets[(10, 60)]
+    assert "active" in buckets
+    assert "idle-0" not in buckets
@@ -0,0 +1,36 @@
+"""
+Tests for in-memory session history
+"""
+
+from app.models import session as session_store
+
+
+def test_add_message_unknown_role_keeps_history_aligned():
+    session = session_store.create_session("s-unknown-role", "127.0.0.1")
+    try:
+        assert session_store.add_message("s-unknown-role", "user", "hi")
+        assert session_store.add_message("s-unknown-role", "system", "note")
+        
+        assert len(session.conversation_history) == len(session._summary_lines) == 2
+        summary = session_store.get_conversation_summary("s-unknown-role")
+        assert "- User: hi" in summary
+        assert "- You (AI): note" in summary
+    finally:
+        session_store.delete_session("s-unknown-role")
+
+
+def test_context_envelope_rebuilt_only_when_code_changes():
+    session = session_store.CodeSession(session_id="s-envelope", user_ip="127.0.0.1")
+    calls = []
+    
+    def builder(s):
+        calls.append(s.current_code)
+        return f"envelope:{s.current_code}"
+    
+    session.current_code = "print(1)"
+    assert session_store.get_context_envelope(session, builder) == "envelope:print(1)"
+    assert session_store.get_context_envelope(session, builder) == "envelope:print(1)"
+    
+    session.current_code = "print(2)"
+    assert session_store.get_context_envelope(session, builder) == "envelope:print(2)"
+    assert calls == ["print(1)", "print(2)"]
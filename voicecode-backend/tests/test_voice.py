@@ -0,0 +1,95 @@
+"""
+Tests for the voice proxy's outbound frame queue
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from app.routers import voice
+from app.routers.voice import CLIENT_QUEUE_MAXSIZE, FramePipe
+
+
+class Recorder:
+    """Collects what a FramePipe sends, with optional per-send delay"""
+    
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.audio = []
+        self.text = []
+        self.sent_at = []
+    
+    async def send_audio(self, audio):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.audio.append(audio)
+        self.sent_at.append(time.monotonic())
+    
+    async def send_text(self, text):
+        self.text.append(text)
+
+
+@pytest.mark.asyncio
+async def test_lone_chunk_is_sent_without_waiting():
+    peer = Recorder()
+    pipe = FramePipe(peer.send_audio, peer.send_text)
+    
+    queued_at = time.monotonic()
+    await pipe.put(b"\x00" * 4096)
+    while not peer.audio:
+        await asyncio.sleep(0)
+    
+    assert peer.sent_at[0] - queued_at < 0.01
+    await pipe.close()
+
+
+@pytest.mark.asyncio
+async def test_queued_chunks_are_coalesced_in_order():
+    peer = Recorder()
+    pipe = FramePipe(peer.send_audio, peer.send_text)
+    
+    for i in range(5):
+        await pipe.put(bytes([i]))
+    await pipe.put("text")
+    await pipe.put(b"\x05")
+    await pipe.close()
+    
+    assert peer.audio == [b"\x00\x01\x02\x03\x04", b"\x05"]
+    assert peer.text == ["text"]
+
+
+@pytest.mark.asyncio
+async def test_burst_to_fast_client_drops_nothing():
+    peer = Recorder()
+    pipe = FramePipe(peer.send_audio, peer.send_text, maxsize=CLIENT_QUEUE_MAXSIZE, drop_audio=True)
+    
+    # TTS audio arrives faster than real time, well past the queue size
+    chunks = [bytes([i % 256]) * 64 for i in range(CLIENT_QUEUE_MAXSIZE * 6)]
+    for chunk in chunks:
+        await pipe.put(chunk)
+    await pipe.close()
+    
+    assert pipe.dropped == 0
+    assert b"".join(peer.audio) == b"".join(chunks)
+
+
+@pytest.mark.asyncio
+async def test_stalled_client_sheds_oldest_audio(monkeypatch):
+    monkeypatch.setattr(voice, "SLOW_CLIENT_SECONDS", 0.01)
+    peer = Recorder(delay=0.05)
+    pipe = FramePipe(peer.send_audio, peer.send_text, maxsize=4, drop_audio=True)
+    
+    await pipe.put(b"first")
+    await asyncio.sleep(0.02)  # writer is now stuck sending "first"
+    
+    started = time.monotonic()
+    for i in range(20):
+        await pipe.put(bytes([i]))
+    # The reader never waited on the stalled send
+    assert time.monotonic() - started < 0.01
+    assert pipe.queue.qsize() == 4
+    
+    await pipe.close()
+    assert pipe.dropped == 16
+    assert peer.audio == [b"first", bytes([16, 17, 18, 19])]